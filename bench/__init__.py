@@ -0,0 +1,4 @@
+"""
+Benchmarks for the lexer, parser and interpreter.
+Run `python -m bench --help` from the repository root
+"""
@@ -0,0 +1,92 @@
+from bench import corpus, runner
+import argparse
+import sys
+
+BASELINE = "bench/baseline.json"
+RESULTS = "bench/results.json"
+
+
+def report(results):
+    for name, phases in results["results"].items():
+        for phase, result in phases.items():
+            seconds, count = result["seconds"], result["count"]
+            line = "%-24s %-6s %10.4fs %8d" % (name, phase, seconds, count)
+            if "peak" in result:
+                line += " %10.1fMB" % (result["peak"] / (1 << 20))
+            print(line)
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(
+        prog="python -m bench", description="Time the lexer, parser and interpreter"
+    )
+    commands = args.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="time the corpus and save the results")
+    run.add_argument("-o", "--output", default=RESULTS, help="JSON file to write")
+    run.add_argument("-r", "--repeat", type=int, default=5, help="best of as many runs")
+    run.add_argument("-w", "--workload", action="append", help="only these workloads")
+
+    scale = commands.add_parser("scale", help="time generated programs of any size")
+    scale.add_argument("sizes", type=int, nargs="+", help="statements in each program")
+    scale.add_argument("-o", "--output", default=RESULTS, help="JSON file to write")
+    scale.add_argument("-r", "--repeat", type=int, default=1, help="best of as many runs")
+    scale.add_argument("-p", "--phase", action="append", help="only these phases")
+    scale.add_argument("-m", "--memory", action="store_true", help="trace peak memory")
+    scale.add_argument("-n", "--nested", action="store_true", help="sizes are nesting depths")
+    scale.add_argument("--seed", type=int, default=0)
+
+    compare = commands.add_parser("compare", help="flag regressions from a baseline")
+    compare.add_argument("current", nargs="?", default=RESULTS, help="JSON to check")
+    compare.add_argument(
+        "-b", "--baseline", default=BASELINE, help="JSON to check against"
+    )
+    compare.add_argument(
+        "-t", "--threshold", type=float, default=0.1, help="slowdown ratio allowed"
+    )
+    compare.add_argument(
+        "-s", "--slack", type=float, default=0.001, help="slowdown seconds allowed"
+    )
+
+    args = args.parse_args(argv)
+
+    if args.command == "run":
+        workloads = [
+            w
+            for w in corpus.workloads()
+            if args.workload is None or w.name in args.workload
+        ]
+        results = runner.run(workloads, repeat=args.repeat)
+        runner.save(results, args.output)
+        report(results)
+        return 0
+
+    if args.command == "scale":
+        phases = corpus.PHASES if args.phase is None else tuple(args.phase)
+        if args.nested:
+            workloads = corpus.nesting(args.sizes, phases=phases)
+        else:
+            workloads = corpus.scale(args.sizes, seed=args.seed, phases=phases)
+        results = runner.run(workloads, repeat=args.repeat, memory=args.memory)
+        runner.save(results, args.output)
+        report(results)
+        return 0
+
+    baseline, current = runner.load(args.baseline), runner.load(args.current)
+    regressions = runner.compare(
+        baseline, current, threshold=args.threshold, slack=args.slack
+    )
+    # not a regression, but not checked either
+    for name, phase in runner.missing(baseline, current):
+        print("%-24s %-6s no baseline" % (name, phase))
+    for name, phase, before, after in regressions:
+        change = (after / before - 1) * 100
+        print(
+            "%-24s %-6s %10.4fs -> %.4fs (%+.0f%%)"
+            % (name, phase, before, after, change)
+        )
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+from typing import NamedTuple
+
+from bench.generate import Shape, generate
+
+SAMPLES = "tests/sample"
+PHASES = ("lex", "parse", "exec")
+# programs spending their time running, timed on the other engines as well
+RUNS = PHASES + ("closure", "vm")
+TAB = "\t"
+
+
+class Workload(NamedTuple):
+    """
+    A program to time, and the phases it goes through
+    """
+
+    name: str
+    source: str
+    phases: tuple = PHASES
+
+
+def sample(name, phases=PHASES):
+    with open(f"{SAMPLES}/{name}.ns", encoding="utf-8") as f:
+        return Workload(name, f.read(), phases)
+
+
+def statements(count):
+    """
+    Straight-line assignments and arithmetic
+    """
+    lines = []
+    for i in range(count):
+        lines.append(f"a{i % 100} = ({i} + 3) * {i % 7 + 1} - {i % 5}")
+        lines.append(f"a{i % 100} == {i}")
+    return "\n".join(lines) + "\n"
+
+
+def loops(depth, times):
+    """
+    Nested for loops counting up a variable
+    """
+    lines = ["z = 0"]
+    for d in range(depth):
+        lines.append(f"{TAB * d}for i{d}=0; i{d}<{times}; i{d}++")
+    lines.append(f"{TAB * depth}z++")
+    for d in reversed(range(depth)):
+        lines.append(f"{TAB * d}end")
+    return "\n".join(lines) + "\n"
+
+
+def calls(count):
+    """
+    Function definitions, each called right after
+    """
+    lines = []
+    for i in range(count):
+        lines.append(f"def f{i} x,y")
+        lines.append(f"\tx * y + {i}")
+        lines.append("end")
+        lines.append(f"r{i % 10} = f{i} [{i + 1}, 2]")
+    return "\n".join(lines) + "\n"
+
+
+def comments(count):
+    """
+    Code buried in line and block comments
+    """
+    lines = []
+    for i in range(count):
+        lines.append(f"// line comment {i} with a 'quote' and some words")
+        lines.append(f"/* block comment {i}")
+        lines.append(" spanning two lines */")
+        lines.append(f"c = {i}")
+    return "\n".join(lines) + "\n"
+
+
+def repeated(times):
+    """
+    A function called over and over from a loop
+    """
+    lines = ["def f x,y", "\tx * y + 1", "end"]
+    lines.append(f"for i=0; i<{times}; i++")
+    lines.append("\tr = f [i, 2]")
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+
+def crowded(count, times):
+    """
+    A function called over and over, among as many global variables as count
+    """
+    lines = [f"g{i} = {i}" for i in range(count)]
+    lines += ["def f x,y", "\tx * y + g0", "end"]
+    lines.append(f"for i=0; i<{times}; i++")
+    lines.append("\tr = f [i, 2]")
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+
+def library(count):
+    """
+    Functions of a few lines each, only the first of them ever called
+    """
+    lines = []
+    for i in range(count):
+        lines.append(f"def f{i} x,y")
+        lines.append(f"\tif x > {i}")
+        lines.append(f"\t\tx = x - {i}")
+        lines.append("\tend")
+        lines.append(f"\tx * y + {i}")
+        lines.append("end")
+    lines.append("r = f0 [1, 2]")
+    return "\n".join(lines) + "\n"
+
+
+def nested(depth):
+    """
+    A sum nested in as many parentheses as depth
+    """
+    return "a = " + "(" * depth + "1" + " + 1)" * depth + "\n"
+
+
+def workloads():
+    """
+    Every workload in the corpus
+    """
+    return [
+        sample("arithmetic_expressions"),
+        sample("for_loop_nested", phases=RUNS),
+        sample("function_with_return", phases=RUNS),
+        sample("nested_structures", phases=RUNS),
+        sample("sample", phases=RUNS),
+        # not a valid program. Lexing is all it is good for
+        sample("fibonacci", phases=("lex",)),
+        Workload("statements", statements(2000)),
+        Workload("loops", loops(3, 20), RUNS),
+        Workload("calls", calls(500), RUNS),
+        Workload("comments", comments(2000)),
+        Workload("generated", generate(Shape(statements=2000), seed=0)),
+        Workload("nested", nested(1000)),
+        Workload("repeated", repeated(2000), RUNS),
+        Workload("crowded", crowded(10000, 1000), RUNS),
+        Workload("library", library(1000), PHASES + ("lazy",)),
+    ]
+
+
+def scale(sizes, shape=Shape(), seed=0, phases=PHASES):
+    """
+    Generated programs growing in statement count, all of the same shape
+    """
+    return [
+        Workload(str(size), generate(shape._replace(statements=size), seed), phases)
+        for size in sizes
+    ]
+
+
+def nesting(depths, phases=PHASES):
+    """
+    Expressions growing in nesting depth
+    """
+    return [Workload(str(depth), nested(depth), phases) for depth in depths]
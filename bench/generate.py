@@ -0,0 +1,219 @@
+"""
+Generates valid NonDeScript programs of any size and shape, reproducible from a seed
+"""
+
+from typing import NamedTuple
+import argparse
+import random
+import sys
+
+TAB = "\t"
+SEEDS = 8
+WORDS = ("note", "todo", "remember", "check", "see", "fixed")
+
+
+class Shape(NamedTuple):
+    """
+    Knobs for a generated program. Rates are chances per statement
+    """
+
+    # statements in the program, nested ones included
+    statements: int = 1000
+    # nesting of parenthesized expressions
+    depth: int = 2
+    # def and procedure definitions, called after being defined
+    defs: int = 10
+    procedures: int = 10
+    # nesting of for loops, and iterations of each loop
+    loops: int = 2
+    times: int = 3
+    # items in list literals
+    items: int = 5
+    # comment lines per statement
+    comments: float = 0.1
+    ifs: float = 0.1
+    prints: float = 0.05
+
+
+class Generator:
+    """
+    Writes programs statement by statement. Seed variables only ever hold small
+    positive values, and expressions only read them, so values stay bounded
+    however long the program is
+    """
+
+    def __init__(self, shape, seed=0):
+        self.shape = shape
+        self.random = random.Random(seed)
+        self.left = shape.statements
+        self.results = 0
+        # routines defined so far, callable from then on
+        self.routines = 0
+        self.defined = []
+
+    def literal(self):
+        return str(self.random.randint(1, 9))
+
+    def operand(self):
+        # literals and seeds are kept positive: zero arguments trip calls up
+        r = self.random.random()
+        return f"s{self.random.randrange(SEEDS)}" if r < 0.5 else self.literal()
+
+    def expression(self, depth=None):
+        depth = self.shape.depth if depth is None else depth
+        terms = [self.operand() for _ in range(self.random.randint(2, 4))]
+        # the grammar takes one parenthesized term per level at most
+        if depth > 0:
+            terms[self.random.randrange(len(terms))] = f"({self.expression(depth - 1)})"
+        expr = terms[0]
+        for term in terms[1:]:
+            expr += f" {self.random.choice('+-')} {term}"
+        return expr
+
+    def seed(self):
+        # products of literals only, so the seed stays small and positive
+        return f"s{self.random.randrange(SEEDS)} = {self.literal()} * {self.literal()}"
+
+    def result(self):
+        self.results += 1
+        return f"v{self.results % 1000} = {self.expression()}"
+
+    def listing(self):
+        items = ", ".join(self.operand() for _ in range(self.shape.items))
+        return f"l{self.random.randrange(100)} = [{items}]"
+
+    def comment(self, indent):
+        if self.random.random() < 0.5:
+            return [f"{indent}// {self.random.choice(WORDS)} {self.literal()}"]
+        return [
+            f"{indent}/* {self.random.choice(WORDS)}",
+            f"{indent} {self.literal()} */",
+        ]
+
+    def simple(self):
+        r = self.random.random()
+        if r < self.shape.prints:
+            return f"prnt s{self.random.randrange(SEEDS)}"
+        if r < 0.2:
+            return self.seed()
+        if r < 0.3:
+            return self.listing()
+        return self.result()
+
+    def block(self, lines, depth, loops):
+        """
+        A few statements at an indent, some of them blocks themselves
+        """
+        indent = TAB * depth
+        for _ in range(self.random.randint(1, 3)):
+            if self.left <= 0:
+                return
+            self.statement(lines, indent, depth, loops)
+
+    def statement(self, lines, indent, depth=0, loops=0):
+        shape = self.shape
+        self.left -= 1
+
+        while self.random.random() < shape.comments:
+            lines.extend(self.comment(indent))
+
+        r = self.random.random()
+
+        if loops < shape.loops and r < 0.1:
+            i = f"i{loops}"
+            lines.append(f"{indent}for {i}=0; {i}<{shape.times}; {i}++")
+            self.block(lines, depth + 1, loops + 1)
+            lines.append(f"{indent}end")
+        elif r < 0.1 + shape.ifs:
+            seed = self.random.randrange(SEEDS)
+            lines.append(f"{indent}if s{seed} > {self.literal()}")
+            self.block(lines, depth + 1, loops)
+            lines.append(f"{indent}else")
+            self.block(lines, depth + 1, loops)
+            lines.append(f"{indent}end")
+        elif depth == 0 and len(self.defined) > 0 and r < 0.1 + shape.ifs + 0.1:
+            kind, name = self.random.choice(self.defined)
+            if kind == "def":
+                args = f"s{self.random.randrange(SEEDS)},{self.literal()}"
+                lines.append(f"r{self.random.randrange(10)} = {name} [{args}]")
+            else:
+                lines.append(f"exec {name}")
+        else:
+            lines.append(indent + self.simple())
+
+    def definitions(self, lines):
+        """
+        Defs and procedures, spread over the program
+        """
+        total = self.shape.defs + self.shape.procedures
+        n = self.routines
+        if n >= total or self.random.random() > total / max(self.shape.statements, 1):
+            return
+
+        self.left -= 1
+        self.routines += 1
+        if n < self.shape.defs:
+            name = f"f{n}"
+            lines.append(f"def {name} a,b")
+            lines.append(f"{TAB}a * {self.literal()} + b")
+            lines.append("end")
+            self.defined.append(("def", name))
+        else:
+            name = f"p{n}"
+            lines.append(f"procedure {name}")
+            self.block(lines, 1, self.shape.loops)
+            lines.append("end")
+            self.defined.append(("procedure", name))
+
+    def lines(self):
+        """
+        Yield the program line by line
+        """
+        for i in range(SEEDS):
+            yield f"s{i} = {self.literal()}"
+
+        while self.left > 0:
+            lines = []
+            self.definitions(lines)
+            if self.left > 0:
+                self.statement(lines, "")
+            yield from lines
+
+
+def generate(shape=Shape(), seed=0):
+    """
+    A program as a string
+    """
+    return "\n".join(Generator(shape, seed).lines()) + "\n"
+
+
+def write(f, shape=Shape(), seed=0):
+    """
+    Stream a program into a file, never holding it whole in memory
+    """
+    for line in Generator(shape, seed).lines():
+        f.write(line + "\n")
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(
+        prog="python -m bench.generate", description="Generate a NonDeScript program"
+    )
+    for field, default in Shape._field_defaults.items():
+        args.add_argument(f"--{field}", type=type(default), default=default)
+    args.add_argument("--seed", type=int, default=0)
+    args.add_argument("-o", "--output", help="file to write, standard output if none")
+    args = args.parse_args(argv)
+
+    shape = Shape(**{field: getattr(args, field) for field in Shape._fields})
+
+    if args.output is None:
+        write(sys.stdout, shape, args.seed)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            write(f, shape, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
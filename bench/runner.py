@@ -0,0 +1,197 @@
+from src.exc import EOF
+from src.interp import Interpreter
+from src.lang.grammar import Lang
+from src.lexer import Lexer
+from src.parser import Parser
+from contextlib import redirect_stdout
+import gc
+import io
+import json
+import platform
+import time
+import tracemalloc
+
+
+def lex(source):
+    """
+    Time Lexer.next over the whole source
+    """
+    lexer = Lexer(Lang, source)
+    count = 0
+
+    start = time.perf_counter()
+    while lexer.next() is not False:
+        count += 1
+    return time.perf_counter() - start, count
+
+
+def parse(source):
+    """
+    Time Parser.parse plus build_ast over the whole source
+    """
+    parser = Parser(Lang, source)
+    count = 0
+
+    start = time.perf_counter()
+    while True:
+        instr = parser.parse()
+        if instr is False or instr is None:
+            break
+        parser.build_ast(instr)
+        count += 1
+    return time.perf_counter() - start, count
+
+
+def execute(source):
+    """
+    Time Interpreter.exec_next over a program already loaded
+    """
+    interp = Interpreter().read(source)
+    count = 0
+
+    start = time.perf_counter()
+    try:
+        while True:
+            interp.exec_next()
+            count += 1
+    except EOF:
+        pass
+    return time.perf_counter() - start, count
+
+
+def run_on(engine, source):
+    """
+    Time Interpreter.run on another engine, compiling included
+    """
+    interp = Interpreter(engine=engine).read(source)
+
+    start = time.perf_counter()
+    count = interp.run()
+    return time.perf_counter() - start, count
+
+
+def closure(source):
+    """
+    Time Interpreter.run on closures compiled from the tree
+    """
+    return run_on("closure", source)
+
+
+def vm(source):
+    """
+    Time Interpreter.run on the stack machine
+    """
+    return run_on("vm", source)
+
+
+def lazy(source):
+    """
+    Time Interpreter.read with function bodies left for their first call
+    """
+    interp = Interpreter(lazy=True)
+
+    start = time.perf_counter()
+    interp.read(source)
+    return time.perf_counter() - start, len(interp.memory.instr)
+
+
+PHASES = {
+    "lex": lex,
+    "parse": parse,
+    "exec": execute,
+    "closure": closure,
+    "vm": vm,
+    "lazy": lazy,
+}
+
+
+def peak(phase, source):
+    """
+    Peak bytes allocated through a phase, the source itself left out
+    """
+    tracemalloc.start()
+    try:
+        PHASES[phase](source)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(workloads, repeat=5, memory=False):
+    """
+    Time each phase of every workload. Keeps the best of repeated runs. Memory
+    is measured on a separate run, as tracing slows everything down
+    """
+    results = {}
+
+    for workload in workloads:
+        phases = {}
+        for phase in workload.phases:
+            best, count = None, 0
+            for _ in range(repeat):
+                # programs print as they go. Keep it out of the report
+                with redirect_stdout(io.StringIO()):
+                    # as timeit does, keep collections from landing on random runs
+                    gc.collect()
+                    gc.disable()
+                    try:
+                        seconds, count = PHASES[phase](workload.source)
+                    finally:
+                        gc.enable()
+                best = seconds if best is None else min(best, seconds)
+            phases[phase] = {"seconds": best, "count": count}
+            if memory:
+                with redirect_stdout(io.StringIO()):
+                    phases[phase]["peak"] = peak(phase, workload.source)
+        results[workload.name] = phases
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.1, slack=0.001):
+    """
+    List phases running slower than the baseline by more than threshold, as
+    (workload, phase, baseline seconds, current seconds) tuples. Slowdowns under
+    slack seconds are left out, as timer noise on the smallest workloads
+    """
+    regressions = []
+
+    for name, phases in current["results"].items():
+        for phase, result in phases.items():
+            base = baseline["results"].get(name, {}).get(phase)
+            if base is None:
+                # listed by missing instead
+                continue
+            before, after = base["seconds"], result["seconds"]
+            if after > before * (1 + threshold) and after - before > slack:
+                regressions.append((name, phase, before, after))
+
+    return regressions
+
+
+def missing(baseline, current):
+    """
+    List phases with no baseline to compare against, as (workload, phase) tuples
+    """
+    return [
+        (name, phase)
+        for name, phases in current["results"].items()
+        for phase in phases
+        if phase not in baseline["results"].get(name, {})
+    ]
+
+
+def load(filename):
+    with open(filename, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(report, filename):
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
@@ -8,7 +8,12 @@ def run(filename):
     if not filename:
         return
 
-    interp = Interpreter().read(filename, is_file=True)
+    if filename == "-":
+        # run piped scripts as they come in
+        chunks = iter(lambda: sys.stdin.buffer.read1(4096), b"")
+        interp = Interpreter().read(chunks, is_stream=True)
+    else:
+        interp = Interpreter().read(filename, is_file=True)
 
     with open(".debug", "w") as log:
         try:
@@ -0,0 +1,130 @@
+"""
+Programs compiled to disk, much like Python's .pyc files. A script left unchanged
+since it was last read is loaded as is, without being lexed or parsed again
+"""
+
+import copyreg
+import gc
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from contextlib import contextmanager
+
+from src.lexer import LineIndex
+
+DIRECTORY = "__nscache__"
+SUFFIX = ".nsc"
+MAGIC = b"NSC\0"
+
+
+def lines():
+    """
+    Stands for the line index of the source, which is not stored. Lexemes loaded
+    take the one of the source read instead
+    """
+    raise pickle.UnpicklingError("Line index loaded with no source")
+
+
+class Pickler(pickle.Pickler):
+    def __init__(self, file, **kwargs):
+        super().__init__(file, **kwargs)
+        # looked up by type, so objects of any other type go by at no cost. Shared
+        # by every lexeme, the index is written once and referred to after that
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table[LineIndex] = lambda index: (lines, ())
+
+
+class Unpickler(pickle.Unpickler):
+    def __init__(self, file, index):
+        super().__init__(file)
+        self.index = index
+
+    def find_class(self, module, name):
+        if module == __name__ and name == lines.__name__:
+            return lambda: self.index
+        return super().find_class(module, name)
+
+
+@contextmanager
+def uncollected():
+    """
+    Hold garbage collection off for a while. A program is stored and loaded as a
+    great many objects, none of them garbage, that collections would otherwise walk
+    over and over as they come
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def path(filename, directory=None):
+    """
+    Where the compiled form of a source file is kept. By default, in a directory
+    next to it
+    """
+    head, tail = os.path.split(filename)
+    if directory is None:
+        directory = os.path.join(head, DIRECTORY)
+    name = "%s.%s%s" % (os.path.splitext(tail)[0], sys.implementation.cache_tag, SUFFIX)
+    return os.path.join(directory, name)
+
+
+def header(lang, src, lazy=False):
+    """
+    What a compiled file starts with. Any change to the source or to the language
+    makes for another, as does leaving function bodies unparsed or not
+    """
+    version = lang.version.to_bytes(4, "little") + bytes([lazy])
+    return MAGIC + version + hashlib.sha256(src).digest()
+
+
+def load(filename, lexer, lang, directory=None, lazy=False):
+    """
+    Instructions, statement starts and statement firsts compiled from the source of
+    lexer, or None if there are none up to date. Lazy ones only load as lazy
+    """
+    expected = header(lang, lexer.src, lazy)
+
+    try:
+        with open(path(filename, directory), "rb") as f:
+            if f.read(len(expected)) != expected:
+                return None
+            with uncollected():
+                return Unpickler(f, lexer.lines).load()
+    except Exception:
+        # missing, cut short or otherwise broken. The program is compiled again
+        return None
+
+
+def dump(filename, lexer, lang, compiled, directory=None, lazy=False):
+    """
+    Store instructions, statement starts and statement firsts compiled from the
+    source of lexer. Anywhere it can't be written, the program is compiled on every
+    read instead
+    """
+    target = path(filename, directory)
+
+    try:
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        # written aside and moved in place, so a concurrent read never sees half
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(target) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f, uncollected():
+                f.write(header(lang, lexer.src, lazy))
+                Pickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(compiled)
+            # readable by whoever can read the source, as mkstemp is private
+            os.chmod(temp, os.stat(filename).st_mode & 0o666)
+            os.replace(temp, target)
+        except BaseException:
+            os.unlink(temp)
+            raise
+    except (OSError, pickle.PicklingError, RecursionError):
+        return False
+
+    return True
@@ -0,0 +1,243 @@
+"""
+Syntax trees compiled into nested Python closures. Every node becomes a function
+taking no arguments, specialized for its shape, that calls the functions of its
+operands directly. Evaluating a node is then a single call, with no dispatch on
+its type as it runs
+"""
+
+import operator
+from functools import partial
+
+from src import node
+from src.lang import data
+from src.lang import operator as op
+from src.lang.base import IS_CONTROL
+
+# operators done by a Python builtin, rather than through their eval
+OPERATIONS = {
+    op.Add.kind: operator.add,
+    op.Subtract.kind: operator.sub,
+    op.Multiply.kind: operator.mul,
+    op.Divide.kind: operator.truediv,
+    op.Greater.kind: operator.gt,
+    op.Lesser.kind: operator.lt,
+    op.Equal.kind: operator.eq,
+    op.Unequal.kind: operator.ne,
+}
+
+STEPS = {
+    op.Increment.kind: 1,
+    op.Decrement.kind: -1,
+}
+
+# how deep closures call into each other. Trees nested deeper are walked instead,
+# as the Python stack would not hold them
+DEPTH = 100
+
+
+class Closures:
+    """
+    Closures of the nodes of a program. A node is walked as the tree walker does
+    the first time it runs, and compiled the next: most of a program runs once,
+    and compiling it costs more than that
+    """
+
+    def __init__(self, interp):
+        self.interp = interp
+        # node id -> the node, kept so that its id is not handed to another, and
+        # its closure, None while it has only run once. Top-level statements apart
+        # from expressions, as they also check whether their block is to be run
+        self.statements = {}
+        self.expressions = {}
+
+    def clear(self):
+        self.statements.clear()
+        self.expressions.clear()
+
+    def statement(self, s):
+        """
+        Function running a top-level statement
+        """
+        compiled = self.statements.get(id(s))
+        if compiled is None:
+            self.statements[id(s)] = (s, None)
+            return partial(self._walk, s)
+        if compiled[1] is None:
+            compiled = self.statements[id(s)] = (s, self._statement(s))
+        return compiled[1]
+
+    def expression(self, n):
+        """
+        Function evaluating an expression
+        """
+        compiled = self.expressions.get(id(n))
+        if compiled is None:
+            self.expressions[id(n)] = (n, None)
+            return partial(self.interp.walk, n)
+        if compiled[1] is None:
+            compiled = self.expressions[id(n)] = (n, self._expression(n))
+        return compiled[1]
+
+    def _walk(self, s):
+        """
+        Run a statement as the tree walker does
+        """
+        interp = self.interp
+        if isinstance(s, node.Statement):
+            return interp.eval(s)
+        return interp.walk(s) if interp.ctrl_stack[-1] else None
+
+    def _statement(self, s):
+        interp = self.interp
+        enabled = interp.ctrl_stack
+
+        if isinstance(s, node.Statement):
+            run = partial(s.keyword.eval, interp, s)
+            # control statements run even where the block is not to be executed
+            if s.keyword.category & IS_CONTROL:
+                return run
+        else:
+            run = self._expression(s)
+
+        def statement():
+            return run() if enabled[-1] else None
+
+        return statement
+
+    def _expression(self, n):
+        """
+        Compile operands first, then what they are for. Walked with an explicit
+        stack, as the tree walker does
+        """
+        # closures compiled, along with how deep each calls
+        values = []
+        stack = [(n, False)]
+
+        while len(stack) > 0:
+            n, ready = stack.pop()
+            operands = () if ready or n is None else n.operands()
+
+            if len(operands) > 0:
+                stack.append((n, True))
+                for operand in reversed(operands):
+                    stack.append((operand, False))
+                continue
+
+            count = len(n.operands()) if n is not None else 0
+            compiled = values[len(values) - count :]
+            del values[len(values) - count :]
+
+            depth = 1 + max((d for _, d in compiled), default=0)
+            if depth > DEPTH:
+                values.append((partial(self.interp.walk, n), 1))
+            else:
+                values.append((self._node(n, [f for f, _ in compiled]), depth))
+
+        return values[-1][0]
+
+    def _node(self, n, operands):
+        """
+        Closure of a node, given the ones of its operands
+        """
+        interp = self.interp
+        memory = interp.memory
+        kind = type(n)
+
+        if kind is node.Literal:
+            value = n.constant.eval()
+            return lambda: value
+
+        if kind is node.Name:
+            word = n.identifier.word
+            return lambda: memory.scope[-1][word]
+
+        if kind is node.BinOp:
+            return self._bin_op(n, *operands)
+
+        if kind is node.Assign:
+            if type(n.target) is not node.Name:
+                return partial(fail, "Cannot assign to %s" % (n.target,))
+            return self._assign(n, *operands)
+
+        if kind is node.PostOp:
+            step = STEPS.get(n.operator.kind)
+            if type(n.operand) is not node.Name or step is None:
+                return partial(fail, "Cannot apply %s to %s" % (n.operator, n.operand))
+            word = n.operand.identifier.word
+
+            def post_op():
+                scope = memory.scope[-1]
+                scope[word] += step
+                return scope[word]
+
+            return post_op
+
+        if kind is node.UnaryOp or kind is node.Param:
+            evaluate = (n.operator if kind is node.UnaryOp else n.parameter).eval
+            (operand,) = operands
+            return lambda: evaluate(
+                memory.scope[-1], arguments=operand(), interp=interp
+            )
+
+        if kind is node.ListLit:
+            items = tuple(operands)
+            return lambda: data.List([item() for item in items])
+
+        if kind is node.Call:
+            evaluate = n.callee.identifier.eval
+            (arguments,) = operands
+            return lambda: evaluate(memory.scope[-1], arguments(), interp=interp)
+
+        if n is None:
+            return lambda: None
+
+        return partial(interp.walk, n)
+
+    def _bin_op(self, n, left, right):
+        memory = self.interp.memory
+        f = OPERATIONS.get(n.operator.kind)
+
+        if f is None:
+            evaluate = n.operator.eval
+            return lambda: evaluate(left(), right(), memory.scope[-1])
+
+        # the commonest shapes, read right out of scope
+        if type(n.left) is node.Name and type(n.right) is node.Name:
+            a, b = n.left.identifier.word, n.right.identifier.word
+
+            def names():
+                scope = memory.scope[-1]
+                return f(scope[a], scope[b])
+
+            return names
+
+        if type(n.left) is node.Name and type(n.right) is node.Literal:
+            a, value = n.left.identifier.word, n.right.constant.eval()
+            return lambda: f(memory.scope[-1][a], value)
+
+        return lambda: f(left(), right())
+
+    def _assign(self, n, value):
+        memory = self.interp.memory
+        identifier = n.target.identifier
+        word = identifier.word
+
+        # the value of an assignment is its target, as Assign.eval gives
+        if type(n.value) is node.Literal:
+            constant = n.value.constant.eval()
+
+            def assign_constant():
+                memory.scope[-1][word] = constant
+                return identifier
+
+            return assign_constant
+
+        def assign():
+            memory.scope[-1][word] = value()
+            return identifier
+
+        return assign
+
+
+def fail(message):
+    raise Exception(message)
@@ -1,5 +1,16 @@
 class UnexpectedSymbol(Exception):
-    pass
+    def __init__(self, lexeme, expecting=()):
+        super().__init__(lexeme, expecting)
+        self.lexeme = lexeme
+        self.expecting = expecting
+
+    def __str__(self):
+        # the position is only resolved when the error is shown
+        lexeme = self.lexeme
+        return (
+            f'Unexpected "{lexeme.word}" at ({lexeme.line}:{lexeme.char}). '
+            f"Expecting: {', '.join(self.expecting)}"
+        )
 
 
 class UnexpectedEOF(Exception):
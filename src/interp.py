@@ -1,16 +1,25 @@
 from src.exc import EOF
-from src.lang import control, data, operator
-from src.lang.base import Keyword, Identifier
-from src.lang.control import Callable, Main
+import src.cache
+from src import node, vm
+from src.closure import Closures
+from src.lang import control, data
+from src.lang.base import (
+    IS_BLOCK,
+    IS_CONSTANT,
+    IS_CONTROL,
+    IS_FUNCTION,
+    IS_IDENTIFIER,
+    IS_VECTOR,
+)
+from src.lang.control import Main
 from src.lang.grammar import Lang
 from src.parser import Parser
+from src.scope import Scope
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-
-OPERAND_L = 0
-OPERATOR = 1
-OPERAND_R = 2
-UNARY_OP_L = 0
-UNARY_OP_R = 1
+from functools import lru_cache
+import os
 
 
 class Interpreter:
@@ -32,9 +41,11 @@ class Interpreter:
                 "Scope": interp.memory.scope,
                 "Stack": interp.memory.stack,
                 "Ctrl stack": interp.ctrl_stack,
-                "Instruction": interp.memory.instr[interp.instr_pointer]
-                if interp.instr_pointer < len(interp.memory.instr)
-                else None,
+                "Instruction": (
+                    interp.memory.instr[interp.instr_pointer]
+                    if interp.instr_pointer < len(interp.memory.instr)
+                    else None
+                ),
                 "Last result": interp.last,
             }
 
@@ -54,55 +65,277 @@ class Interpreter:
         def __init__(self):
             self.instr = []
             self.stack = []
-            self.scope = [{}]
+            # scopes of the routines running, the global one first
+            self.scope = [Scope()]
+            # byte offset and first instruction of every top-level statement
+            self.starts = []
+            self.firsts = []
+
+    def __init__(self, source=None, lazy=False, processes=1, engine="tree", hot=None):
+        if engine not in ("tree", "closure", "vm"):
+            raise Exception("Unknown engine %s" % (engine,))
 
-    def __init__(self, source=None):
         self.parser = Parser(self.lang, source)
+        # walk the syntax tree, compile it to closures, or to bytecode for a stack
+        # machine
+        self.engine = engine
+        self.closures = Closures(self) if engine == "closure" else None
+        self.vm = None
+        # calls after which a function is translated to Python. None for never
+        self.hot = hot
+        # function -> the function, its calls so far, and its body translated to
+        # Python once they are enough. False if it can't be
+        self.translated = {}
+        # function bodies are parsed when first called. A stream is parsed whole
+        self.lazy = lazy
+        # processes files included are parsed ahead in
+        self.processes = processes
+        # files included so far, and the ones being run
+        self.included = set()
+        self.files = []
         self.lang = self.parser.lang
         self.memory = Interpreter.Memory()
         self.ctrl_stack = [True]
         self.block_stack = [Main()]
         self.instr_pointer = 0
+        # functions being called, which run their statements in a row
+        self.functions = 0
         self.last = None
+        # whether instructions are still pending in a streamed source
+        self.streaming = False
 
-    def read(self, source, is_file=False):
+    def read(self, source, is_file=False, is_stream=False, cache=True):
         """
-        Feeds parser with command
+        Feeds parser with command. A stream is loaded lazily, as execution reaches it.
+        A file is compiled to disk, and loaded from there while left unchanged. Give
+        cache a directory to keep compiled files in, or False to always parse
         """
-        self.parser.set_source(source, is_file)
-        self._load()
+        self.parser.set_source(source, is_file, is_stream)
+        self.parser.lazy = self.lazy and not is_stream
+        self.streaming = is_stream
+
+        if is_file:
+            # it is included already, and the files it includes are found from it
+            path = os.path.realpath(source)
+            self.included.add(path)
+            self.files = [path]
+
+        if is_stream:
+            return self
+
+        # only a program read whole can be stored whole
+        if not is_file or cache is False or len(self.memory.instr) > 0:
+            self._load()
+        else:
+            self._load_compiled(source, None if cache is True else cache)
+
+        self._prefetch(self.memory.instr)
         return self
 
-    def _load(self):
+    def _load_compiled(self, filename, directory=None):
+        """
+        Load a file from the disk cache, or parse it and store it there
+        """
+        lexer, lazy = self.parser.lexer, self.parser.lazy
+        compiled = src.cache.load(filename, lexer, self.lang, directory, lazy)
+
+        if compiled is None:
+            self._load()
+            compiled = (self.memory.instr, self.memory.starts, self.memory.firsts)
+            src.cache.dump(filename, lexer, self.lang, compiled, directory, lazy)
+        else:
+            self.memory.instr, self.memory.starts, self.memory.firsts = compiled
+            # carry on past the program as if it was just parsed
+            self.parser.seek(len(lexer.src), count=len(self.memory.instr))
+
+    def _load(self, statement=False):
         """
         Build grammar tree for all instructions loaded in parser and stores
-        it into memory for later execution
+        it into memory for later execution. If statement is set, stop after the
+        next complete top-level statement, nested blocks included
         """
 
         while True:
-            instr = self.parser.parse()
+            start = self.parser.tell()
+            instructions = self.parser.statement()
 
-            if instr is False or instr is None:
+            if instructions is False:
                 return False
 
-            # build abstract syntax tree
-            ast = self.parser.build_ast(instr)
+            self.memory.starts.append(start)
+            self.memory.firsts.append(len(self.memory.instr))
 
             # append to instruction memory block
-            self.memory.instr.append(ast)
+            self.memory.instr.extend(instructions)
+
+            if statement:
+                return True
+
+    def edit(self, start, end, text):
+        """
+        Replace source bytes start to end with text. Only the top-level statements
+        touched by the edit are parsed and built again
+        """
+        if self.streaming:
+            raise Exception("Cannot edit a source still being streamed")
+
+        memory = self.memory
+        parser = self.parser
+        old = parser.lexer
+        lexer = old.edit(start, end, text)
+        delta = len(lexer.src) - len(old.src)
+        edit_end = end + delta
+
+        # first statement touched. The byte before the edit may stick to it
+        first = max(bisect_right(memory.starts, start - 1) - 1, 0)
+        resume = memory.starts[first] if len(memory.starts) > 0 else 0
+        address = memory.firsts[first] if len(memory.firsts) > 0 else 0
+
+        starts, firsts, instructions = [], [], []
+        parser.lexer = lexer
+        parser.seek(resume, count=address)
+
+        try:
+            while True:
+                byte = parser.tell()
+
+                # resync at the first statement boundary left untouched
+                if byte >= edit_end:
+                    old_byte = byte - delta
+                    last = bisect_left(memory.starts, old_byte)
+                    if last < len(memory.starts) and memory.starts[last] == old_byte:
+                        break
+
+                parsed = parser.statement()
+                if parsed is False:
+                    last = len(memory.starts)
+                    break
+
+                starts.append(byte)
+                firsts.append(address + len(instructions))
+                instructions.extend(parsed)
+
+        except Exception:
+            parser.lexer = old
+            parser.seek(len(old.src), count=len(memory.instr))
+            raise
+
+        # swap statements and shift the ones following
+        stop = memory.firsts[last] if last < len(memory.firsts) else len(memory.instr)
+        moved = len(instructions) - (stop - address)
+        memory.instr[address:stop] = instructions
+        memory.starts[first:] = starts + [s + delta for s in memory.starts[last:]]
+        memory.firsts[first:] = firsts + [f + moved for f in memory.firsts[last:]]
+
+        # positions of lexemes kept are resolved against the new source from now on
+        old.lines.forward(start, end, delta, lexer.lines)
+        parser.seek(len(lexer.src), count=len(memory.instr))
+        # compiled again as it runs next
+        self.vm = None
+        if self.closures is not None:
+            self.closures.clear()
+        return self
 
     @staticmethod
     def terminate():
         return
 
-    def _exec_all(self, source=None, build=True):
+    def directory(self):
+        """
+        Where the file being run is, which paths included are relative to
+        """
+        return os.path.dirname(self.files[-1]) if len(self.files) > 0 else os.getcwd()
+
+    def include(self, name):
+        """
+        Run a source file as part of the program, where it is included. A file is run
+        once, however many times it is included
+        """
+        path = os.path.realpath(os.path.join(self.directory(), name))
+        if path in self.included:
+            return None
+        self.included.add(path)
+
+        stat = os.stat(path)
+        instructions = module(
+            type(self), path, stat.st_mtime_ns, stat.st_size, self.lazy
+        )
+        self.files.append(path)
+        self._prefetch(instructions)
+
+        if self.engine == "vm":
+            try:
+                vm.VM(self, vm.compile(instructions, steps=False)).run()
+            finally:
+                self.files.pop()
+            return None
+
+        # run it on its own, as a routine is. Blocks only ever jump within a file,
+        # so the ones it leaves open are closed where it ends
+        memory = self.memory
+        depths = (
+            len(self.block_stack),
+            len(self.ctrl_stack),
+            len(memory.scope),
+            len(memory.stack),
+        )
+
+        try:
+            self._run(instructions, 0, 0)
+        except EOF:
+            pass
+        finally:
+            blocks, enabled, scopes, frames = depths
+            del self.block_stack[blocks:]
+            del self.ctrl_stack[enabled:]
+            del memory.scope[scopes:]
+            del memory.stack[frames:]
+            self.files.pop()
+
+        return None
+
+    def _prefetch(self, instructions):
+        """
+        Parse the files included by instructions ahead, to the disk cache, along with
+        the files they include in turn. Files on the same level are parsed in parallel
+        """
+        if self.processes < 2:
+            return
+
+        seen = set(self.included)
+        pending = includes(instructions, self.directory()) - seen
+
+        if len(pending) == 0:
+            return
+
+        with ProcessPoolExecutor(self.processes) as pool:
+            while len(pending) > 0:
+                seen |= pending
+                found = pool.map(precompile, pending, [self.lazy] * len(pending))
+                pending = set().union(*found) - seen
+
+    def _run(self, instr, address, depth):
+        """
+        Run instr from address on its own, until the blocks open drop under depth
+        """
+        memory = self.memory
+        saved = memory.instr, self.instr_pointer, self.streaming
+        memory.instr, self.instr_pointer, self.streaming = instr, address, False
+
+        try:
+            while len(self.block_stack) >= depth:
+                self.exec_next()
+        finally:
+            memory.instr, self.instr_pointer, self.streaming = saved
+
+    def _exec_all(self, source=None):
         """
         Execute all lines in source code
         """
         r = None
 
         for i in source or []:
-            r = self.eval(i) if build is None else self.eval(self.parser.build_ast(i))
+            r = self.eval(i)
             self.last = r
 
         return r
@@ -111,9 +344,18 @@ class Interpreter:
         """
         Executes one line at a time
         """
+        if self.engine == "vm":
+            return self._vm().next()
+
+        if self.streaming and self.instr_pointer >= len(self.memory.instr):
+            self.streaming = self._load(statement=True)
+
         try:
             # eval the instructions
-            r = self.eval(self.memory.instr[self.instr_pointer])
+            if self.closures is None:
+                r = self.eval(self.memory.instr[self.instr_pointer])
+            else:
+                r = self.closures.statement(self.memory.instr[self.instr_pointer])()
             self.last = r
 
         except IndexError:
@@ -122,6 +364,30 @@ class Interpreter:
         self.instr_pointer += 1
         return r
 
+    def run(self):
+        """
+        Execute the rest of the program. Returns how many lines were run
+        """
+        if self.engine == "vm":
+            return self._vm().run()
+
+        count = 0
+        try:
+            while True:
+                self.exec_next()
+                count += 1
+        except EOF:
+            pass
+        return count
+
+    def _vm(self):
+        """
+        Stack machine running the program, compiled on first use
+        """
+        if self.vm is None:
+            self.vm = vm.VM(self)
+        return self.vm
+
     def scope(self):
         """
         Current scope
@@ -132,7 +398,7 @@ class Interpreter:
         """
         Bind a variable with a value
         """
-        if isinstance(i, Identifier):
+        if getattr(i, "category", 0) & IS_IDENTIFIER:
             i = i.word
         self.scope()[i] = v
 
@@ -140,18 +406,23 @@ class Interpreter:
         """
         Get a value from a variable in scope
         """
-        if isinstance(i, Identifier):
+        if getattr(i, "category", 0) & IS_IDENTIFIER:
             i = i.word
-        return self.scope().get(i, None)
+        return self.scope()[i]
 
-    def push_scope(self, namespace=None):
+    def declare(self, routine, entry=None):
         """
-        Open a scope
+        Bind a routine in the current scope, which its calls are nested in. A
+        procedure is run from entry, the code it was declared in and where
         """
-        namespace = namespace or {}
-        scp = namespace.copy()
-        scp.update(self.scope())
-        self.memory.scope.append(scp)
+        scope = self.scope()
+        scope[routine.identifier.word] = control.Closure(routine, scope, entry)
+
+    def push_scope(self, parent=None):
+        """
+        Open a scope nested in parent, by default the current one
+        """
+        self.memory.scope.append(Scope(self.scope() if parent is None else parent))
 
     def pull_scope(self):
         """
@@ -173,17 +444,17 @@ class Interpreter:
         """
         self.instr_pointer += i
 
-    def call(self, routine: Callable, arguments):
+    def call(self, closure, arguments):
         """
         Handle procedure calls
         """
+        routine = closure.routine
         print("Calling routine %s" % (routine.get_identifier()))
 
         # push block
         self.push_block(routine)
 
-        # address & get signature
-        address = routine.address
+        # get signature
         signature = routine.get_signature()
 
         # check signature match with arguments
@@ -193,23 +464,40 @@ class Interpreter:
                 % (len(signature), len(arguments))
             )
 
-        self.push_scope()
+        self.push_scope(closure.scope)
 
-        if len(signature) > 0:
-            # assign calling args to routine signature
-            for k, v in enumerate(self.getval(signature)):
-                self.bind(signature[k][0], arguments[k])
+        # assign calling args to routine signature
+        for k, identifier in enumerate(signature):
+            self.bind(identifier, arguments[k])
 
         # is function. Return last statement eval
-        if isinstance(routine, control.Def):
-            ret = self._exec_all(routine.block)
+        if routine.category & IS_FUNCTION:
+            self.functions += 1
+            try:
+                ret = self._exec_all(routine.get_block())
+            finally:
+                self.functions -= 1
             # print(ret)
-            self.end_call()
+            # no return address of its own: the one on the stack is a caller's
+            self.end_block()
+            self.pull_scope()
             return ret
         # is procedure. Return nothing. Move instruction pointer
         else:
             # push return address to stack
-            self.stack_push({"ret_addr": self.instr_pointer})
+            frame = {"ret_addr": self.instr_pointer}
+            instr, address = closure.entry
+            if self.functions > 0:
+                # a function runs its statements in a row, not one at a time from
+                # here. Run the procedure through before it goes on
+                self.stack_push(frame)
+                self._run(instr, address + 1, len(self.block_stack))
+                return None
+            if instr is not self.memory.instr:
+                # declared in an included file, run there
+                frame["instr"] = self.memory.instr
+                self.memory.instr = instr
+            self.stack_push(frame)
             self.goto(address)
 
     def end_call(self):
@@ -221,6 +509,7 @@ class Interpreter:
         if len(self.memory.stack) > 0:
             stack = self.stack_pull()
             ret_addr = stack.get("ret_addr", None)
+            self.memory.instr = stack.get("instr", self.memory.instr)
 
         self.end_block()
         self.pull_scope()
@@ -247,12 +536,11 @@ class Interpreter:
         """
         Close an FOR statement
         """
-        self.eval(block.increment)
+        self.eval(block.statement.increment)
 
-        if self.eval(block.condition):
+        if self.eval(block.statement.condition):
             self.goto(block.address)
         else:
-            block.done()
             self.end_block()
 
     def get_block(self):
@@ -265,7 +553,7 @@ class Interpreter:
         """
         Open a block of code
         """
-        if not isinstance(block, control.Block):
+        if not getattr(block, "category", 0) & IS_BLOCK:
             raise Exception("Tried to push a non-block statement")
 
         self.block_stack.append(block)
@@ -323,11 +611,15 @@ class Interpreter:
 
     def getval(self, i, **kwargs):
 
-        # it's nested
-        if isinstance(i, list) and not isinstance(i, data.List):
-            return self.getval(i.pop(), **kwargs)
+        category = getattr(i, "category", 0)
+
+        # it's nested. Read through it, as the tree it belongs to may run again
+        while isinstance(i, list) and not category & IS_VECTOR:
+            i = i[-1]
+            category = getattr(i, "category", 0)
+
         # identifiers
-        if isinstance(i, Identifier):
+        if category & IS_IDENTIFIER:
             # return memory address identifier
             if kwargs.get("ref", None) is not None:
                 return i
@@ -336,11 +628,11 @@ class Interpreter:
                 return i.eval(self.scope())
 
         # structs
-        elif isinstance(i, data.Vector):
+        elif category & IS_VECTOR:
             return i
 
         # constants
-        elif isinstance(i, data.Constant):
+        elif category & IS_CONSTANT:
             return i.eval()
         # a value
         else:
@@ -350,55 +642,132 @@ class Interpreter:
     Eval sentences
     """
 
-    def eval(self, i, ref=False):
+    def eval(self, i):
+        """
+        Run a statement, or evaluate an expression
+        """
+        if isinstance(i, node.Statement):
+            # control statements run even where the block is not to be executed
+            if not i.keyword.category & IS_CONTROL and not self.is_read_enabled():
+                return None
+            return i.keyword.eval(self, i)
 
-        if isinstance(i, data.List):
-            for k, v in enumerate(i):
-                i[k] = self.eval(v) if ref is True else self.getval(self.eval(v))
-            return i
+        reduce = self.reducers.get(type(i))
+        if reduce is None:
+            category = getattr(i, "category", 0)
+            return i.eval(self.scope()) if category & IS_IDENTIFIER else i
 
-        if isinstance(i, list) and len(i) > 0:
-            # a control struct
-            if isinstance(i[OPERAND_L], control.Control):
-                return i[OPERAND_L].eval(self, i[1:])
+        # ignore is read is not enabled
+        if not self.is_read_enabled():
+            return None
 
-            # ignore is read is not enabled
-            if not self.is_read_enabled():
-                return None
+        if self.closures is not None:
+            return self.closures.expression(i)()
 
-            # a keyword
-            if isinstance(i[OPERAND_L], Keyword):
-                return i[OPERAND_L].eval(self, i[1:])
-
-            # expressions
-            for k, v in enumerate(i):
-                if isinstance(v, list):
-                    i[k] = self.eval(v)
-
-            # a value
-            if len(i) < 2:
-                ii = i[0]
-                if isinstance(ii, data.Constant):
-                    return ii.eval()
-                else:
-                    return ii
-
-            # unary operation
-            if len(i) < 3:
-                return i[UNARY_OP_L].eval(
-                    self.scope(), arguments=i[UNARY_OP_R], interp=self
-                )
-
-            # assign operations
-            if isinstance(i[OPERATOR], operator.Assign):
-                return i[OPERATOR].eval(
-                    i[OPERAND_L], self.getval(i[OPERAND_R]), self.scope()
-                )
-            # any other binary operation
-            else:
-                return i[OPERATOR].eval(
-                    self.getval(i[OPERAND_L]), self.getval(i[OPERAND_R]), self.scope()
-                )
+        return self.walk(i)
 
-        else:
-            return i.eval(self.scope()) if isinstance(i, Identifier) else i
+    def walk(self, i):
+        """
+        Evaluate an expression bottom up. Nested expressions are walked with an
+        explicit stack rather than recursion, so nesting is only limited by memory
+        """
+        values = []
+        # nodes to evaluate, and whether their operands are evaluated already
+        stack = [(i, False)]
+
+        while len(stack) > 0:
+            n, ready = stack.pop()
+            operands = () if ready else n.operands()
+
+            if len(operands) == 0:
+                self.reducers[type(n)](self, n, values)
+                continue
+
+            stack.append((n, True))
+            for operand in reversed(operands):
+                stack.append((operand, False))
+
+        return values[-1]
+
+    def _literal(self, n, values):
+        values.append(n.constant.eval())
+
+    def _name(self, n, values):
+        values.append(n.identifier.eval(self.scope()))
+
+    def _bin_op(self, n, values):
+        right = values.pop()
+        values[-1] = n.operator.eval(values[-1], right, self.scope())
+
+    def _assign(self, n, values):
+        if not isinstance(n.target, node.Name):
+            raise Exception("Cannot assign to %s" % (n.target,))
+        values[-1] = n.operator.eval(n.target.identifier, values[-1], self.scope())
+
+    def _unary_op(self, n, values):
+        values[-1] = n.operator.eval(self.scope(), arguments=values[-1], interp=self)
+
+    def _post_op(self, n, values):
+        if not isinstance(n.operand, node.Name):
+            raise Exception("Cannot apply %s to %s" % (n.operator, n.operand))
+        values.append(n.operator.eval(self.scope(), arguments=n.operand.identifier))
+
+    def _list(self, n, values):
+        items = data.List(values[len(values) - len(n.items) :])
+        del values[len(values) - len(n.items) :]
+        values.append(items)
+
+    def _call(self, n, values):
+        values[-1] = n.callee.identifier.eval(self.scope(), values[-1], interp=self)
+
+    def _param(self, n, values):
+        values[-1] = n.parameter.eval(self.scope(), arguments=values[-1], interp=self)
+
+    def _none(self, n, values):
+        values.append(None)
+
+    # node type -> how it is evaluated, once its operands are
+    reducers = {
+        node.Literal: _literal,
+        node.Name: _name,
+        node.BinOp: _bin_op,
+        node.Assign: _assign,
+        node.UnaryOp: _unary_op,
+        node.PostOp: _post_op,
+        node.ListLit: _list,
+        node.Call: _call,
+        node.Param: _param,
+        type(None): _none,
+    }
+
+
+@lru_cache(maxsize=64)
+def module(interpreter, path, mtime, size, lazy):
+    """
+    Instructions of a file to include. Parsed once per process while it is left
+    unchanged, or loaded from the disk cache
+    """
+    return tuple(interpreter(lazy=lazy).read(path, is_file=True).memory.instr)
+
+
+def includes(instructions, directory):
+    """
+    Paths of the files included by the top-level instructions given
+    """
+    paths = set()
+    for i in instructions:
+        if isinstance(i, node.Include) and isinstance(i.source, node.Literal):
+            name = i.source.constant.eval()
+            paths.add(os.path.realpath(os.path.join(directory, name)))
+    return paths
+
+
+def precompile(path, lazy=False):
+    """
+    Parse a file to the disk cache, from a process of its own. Returns the paths of
+    the files it includes
+    """
+    if not os.path.exists(path):
+        return set()
+    instructions = Interpreter(lazy=lazy).read(path, is_file=True).memory.instr
+    return includes(instructions, os.path.dirname(path))
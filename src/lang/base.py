@@ -1,5 +1,7 @@
 from abc import ABC
 
+from src.lexer import Position
+
 BRACKET_CLOSE = "</bracket>"
 BRACKET_OPEN = "<bracket>"
 CLAUSE = "<clause>"
@@ -30,17 +32,64 @@ UNARY_OP = "<unary-op>"
 UNARY_POST_OP = "<unary-post-op>"
 WAIT = "<wait>"
 
+# category bits. A class category holds its own bits and those of its bases
+IS_KEYWORD = 1 << 0
+IS_DELIMITER = 1 << 1
+IS_IDENTIFIER = 1 << 2
+IS_CONSTANT = 1 << 3
+IS_VECTOR = 1 << 4
+IS_OPERATOR = 1 << 5
+IS_UNARY_OP = 1 << 6
+IS_UNARY_POST_OP = 1 << 7
+IS_PARAMETER = 1 << 8
+IS_PREPROCESSOR = 1 << 9
+IS_BLANK = 1 << 10
+IS_NEWLINE = 1 << 11
+IS_BLOCK = 1 << 12
+IS_CONTROL = 1 << 13
+IS_CALLABLE = 1 << 14
+IS_FUNCTION = 1 << 15
+IS_ASSIGN = 1 << 16
+
+
+class Tagged:
+    """
+    Tags every subclass with a small integer kind, numbered as classes are created,
+    and a category bitmask, so dispatch is a table lookup or a bit test instead of
+    a walk of the class hierarchy
+    """
+
+    # kind -> class
+    kinds = []
+    kind = None
+    category = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        category = cls.__dict__.get("category", 0)
+        for base in cls.__bases__:
+            category |= getattr(base, "category", 0)
+        cls.category = category
+        cls.kind = Tagged.new_kind(cls)
+
+    @staticmethod
+    def new_kind(cls):
+        """
+        Allocate a kind for a class. Classes whose instances come in variants, like
+        opening and closing delimiters, take one per variant
+        """
+        Tagged.kinds.append(cls)
+        return len(Tagged.kinds) - 1
+
 
-class Lexeme(ABC):
+class Lexeme(Position, Tagged, ABC):
     """
     Base class for every language word
     """
 
     def __init__(self, token, **kwargs):
         self.word = token.word
-        self.line = token.line
-        self.char = token.char
-        self.byte = token.byte
+        self.place(token)
         self.set(kwargs)
 
     def set(self, kwargs):
@@ -75,6 +124,8 @@ class Lexeme(ABC):
 
 
 class Keyword(Lexeme, ABC):
+    category = IS_KEYWORD
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.identifier = None
@@ -91,16 +142,18 @@ class Keyword(Lexeme, ABC):
 
 
 class Delimiter(Lexeme, ABC):
-    pass
+    category = IS_DELIMITER
 
 
 class Identifier(Lexeme):
+    category = IS_IDENTIFIER
+
     @staticmethod
     def type():
         return IDENT
 
     def eval(self, scope, arguments=None, interp=None):
-        v = scope.get(self.word, None)
+        v = scope[self.word]
         if arguments is not None and v is not None:
             return v.call(arguments, interp)
         else:
@@ -114,6 +167,8 @@ class Parentheses(Delimiter):
     def __init__(self, *args, open: bool = True, **kwargs):
         super().__init__(*args, **kwargs)
         self.open = open
+        if not open:
+            self.kind = self.closed
 
     def type(self):
         return DELIM_OPEN if self.open else DELIM_CLOSE
@@ -128,6 +183,8 @@ class Parentheses(Delimiter):
 class Bracket(Delimiter):
     def __init__(self, *args, open: bool = True, **kwargs):
         self.open = open
+        if not open:
+            self.kind = self.closed
         super().__init__(*args, **kwargs)
 
     def type(self):
@@ -169,14 +226,21 @@ class WhiteSpace(Lexeme):
 
 
 class Space(WhiteSpace):
-    pass
+    category = IS_BLANK
 
 
 class NewLine(WhiteSpace):
+    category = IS_NEWLINE
+
     @staticmethod
     def type():
         return NEWLINE
 
 
 class Tab(WhiteSpace):
-    pass
+    category = IS_BLANK
+
+
+# closing delimiters are told apart from opening ones by kind
+Parentheses.closed = Tagged.new_kind(Parentheses)
+Bracket.closed = Tagged.new_kind(Bracket)
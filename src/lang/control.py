@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 
-from src.lang import data
+from src import node
+from src.exc import UnexpectedEOF
+from src.transpile import translate
 from src.lang.base import (
     Keyword,
     IF,
@@ -13,10 +15,17 @@ from src.lang.base import (
     Delimiter,
     NewLine,
     BLOCK_MAIN,
+    IS_BLOCK,
+    IS_CALLABLE,
+    IS_CONTROL,
+    IS_FUNCTION,
+    Tagged,
 )
 
 
-class Callable(ABC):
+class Callable(Tagged, ABC):
+    category = IS_CALLABLE
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.signature = None
@@ -29,17 +38,30 @@ class Callable(ABC):
         pass
 
 
-class Control(ABC):
-    pass
+class Control(Tagged, ABC):
+    category = IS_CONTROL
+
 
+class Block(Tagged):
+    category = IS_BLOCK
+    # statements up to its end, once parsed. None while it is left open
+    length = None
 
-class Block:
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.length = 0
         self.start = None
         self.block = []
 
+    def skip(self, interp):
+        """
+        Go past the end of the block. One left open runs up to the end of the code
+        """
+        if self.length is None:
+            interp.goto(len(interp.memory.instr) - 1)
+        else:
+            interp.move(self.length + 1)
+
 
 class Main(Block):
     @staticmethod
@@ -55,11 +77,11 @@ class If(Keyword, Block, Control):
     def parse(self, parser, **kwargs):
         # store condition pre-built
         condition = parser.build_ast(parser.parse_expression(until=NewLine))
-        return [self, condition]
+        return node.If(self, condition)
 
-    def eval(self, interp, expr):
+    def eval(self, interp, statement):
         # if condition is truthy, interpreter executes the following block
-        interp.push_read_enabled(bool(interp.eval(expr)))
+        interp.push_read_enabled(bool(interp.eval(statement.condition)))
         interp.push_block(self)
 
 
@@ -69,56 +91,54 @@ class Else(Keyword, Control):
         return ELSE
 
     def parse(self, parser, **kwargs):
-        return [self]
+        return node.Else(self)
 
     @staticmethod
-    def eval(interp, expr):
+    def eval(interp, statement):
         # if last block was executed following will not, and vice versa
         interp.toggle_read_enabled()
 
 
 class For(Keyword, Block, Control):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.initialized = False
-        self.init = None
-        self.condition = None
-        self.increment = None
-        self.address = None
-
     @staticmethod
     def type():
         return FOR
 
     def parse(self, parser, **kwargs):
         # store condition pre-built
-        self.init = parser.build_ast(parser.parse_expression(until=NewLine))
-        self.condition = parser.build_ast(parser.parse_expression(until=NewLine))
-        self.increment = parser.build_ast(parser.parse_expression(until=NewLine))
-        return [self]
+        init = parser.build_ast(parser.parse_expression(until=NewLine))
+        condition = parser.build_ast(parser.parse_expression(until=NewLine))
+        increment = parser.build_ast(parser.parse_expression(until=NewLine))
+        return node.For(self, init, condition, increment)
+
+    def eval(self, interp, statement):
+        interp.eval(statement.init)
 
-    def eval(self, interp, *args, **kwargs):
         # if condition is truthy, interpreter executes the following block
-        self.address = interp.instr_pointer
+        if interp.eval(statement.condition):
+            interp.push_block(Loop(statement, interp.instr_pointer))
+        else:
+            # go past the END keyword
+            self.skip(interp)
 
-        if not self.initialized:
-            interp.eval(self.init)
-            interp.push_block(self)
-            self.initialized = True
 
-        if not interp.eval(self.condition):
-            # go past the END keyword
-            interp.goto(self.address + self.length + 1)
+class Loop(Tagged):
+    """
+    A for loop running, opened as its block every time the loop is entered: its
+    statement, and where it starts
+    """
 
-    def done(self):
-        self.initialized = False
+    category = IS_BLOCK
+
+    def __init__(self, statement, address):
+        self.statement = statement
+        self.address = address
 
 
 class Procedure(Keyword, Callable, Block, Control):
     def __init__(self, word, *args, **kwargs):
-        self.address = None
         self.identifier = None
-        self.signature = data.List()
+        self.signature = ()
         super().__init__(word, *args, **kwargs)
 
     @staticmethod
@@ -133,69 +153,160 @@ class Procedure(Keyword, Callable, Block, Control):
         if not isinstance(i, Identifier):
             raise Exception("Procedure must have an identifier")
         else:
-            self.identifier = [i]
+            self.identifier = i
 
         try:
             # get arguments
-            self.signature = parser.build_ast(parser.parse_expression())
+            self.signature = node.signature(parser.build_ast(parser.parse_expression()))
 
         except Exception:
-            self.signature = data.List()
+            self.signature = ()
 
-        return [self, self.identifier, self.signature]
+        return node.Procedure(self, node.Name(self.identifier), self.signature)
 
-    def eval(self, interp, signature):
+    def eval(self, interp, statement):
         print("Procedure is being eval'd")
 
-        # store procedure address
-        self.address = interp.instr_pointer
-
-        # eval procedure identifier, leaving room for dynamic procedures
-        self.identifier = interp.getval(self.identifier, ref=False)
-
         # store identifier & memory address
-        interp.bind(self.identifier.word, self)
+        interp.declare(self, (interp.memory.instr, interp.instr_pointer))
 
         # skip function block. We are just declaring the function
-        interp.move(self.length + 1)
+        self.skip(interp)
 
-    def call(self):
+    def call(self, closure, arguments, interp):
         raise NotImplementedError()
 
 
 class Def(Procedure):
+    category = IS_FUNCTION
+
     def __init__(self, word, pos=(None, None), **kwargs):
         super().__init__(word, pos=(None, None), **kwargs)
-        self.block = []
+        self.block = ()
+        # a copy of the body and its line index, while it is left unparsed
+        self.body = None
+        self.lang = None
 
     def parse(self, parser, **kwargs):
         # parse identifier
-        self.identifier = [parser.next()]
+        self.identifier = parser.next()
 
         try:
             # get arguments
-            self.signature = parser.build_ast(parser.parse_expression())
+            self.signature = node.signature(parser.build_ast(parser.parse_expression()))
         except Exception:
-            self.signature = data.List()
-
-        # get function block
-        self.block = parser.parse_block(until=End)
-
-        return [self, self.identifier, self.signature]
-
-    def eval(self, interp, signature):
-
-        # store procedure address
-        self.address = interp.instr_pointer
-
-        # eval procedure identifier, leaving room for dynamic procedures
-        self.identifier = interp.getval(self.identifier, ref=False)
-
-        # store identifier & memory address
-        interp.bind(self.identifier.word, self)
+            self.signature = ()
+
+        if parser.lazy:
+            # only find where the body ends. It is parsed when first called
+            self.body = parser.skip_block()
+            self.lang = parser.lang
+            self.block = None
+            parser.pull_block()
+        else:
+            self.block = self.parse_body(parser)
+
+        return node.Def(self, node.Name(self.identifier), self.signature, self.block)
+
+    def parse_body(self, parser):
+        """
+        Statements up to the end of the function, its own blocks included. The end
+        closes the function block as it is parsed
+        """
+        block = []
+
+        while True:
+            i = parser.parse()
+
+            if i is False:
+                raise UnexpectedEOF(f"Unexpected EOF at function {self.identifier}")
+
+            if isinstance(i, node.End) and i.keyword.owner is self:
+                return tuple(block)
+
+            block.append(parser.build_ast(i))
+
+    def get_block(self):
+        """
+        Function body, parsed on first call if it was skipped
+        """
+        if self.block is None:
+            # the parser depends on the language, this module included
+            from src.parser import Parser
+
+            # parsed from the copy, where it lies in source. Its lexemes take their
+            # positions from the copy too, as a mapped source may have changed
+            body = self.body
+            parser = Parser(self.lang, body.src)
+            parser.lexer.base, parser.lexer.lines = body.base, body
+            parser.seek(body.base)
+            parser.push_block((0, self))
+            self.block = self.parse_body(parser)
+            self.body = None
+
+        return self.block
+
+    def eval(self, interp, statement):
+
+        # store identifier
+        interp.declare(self)
+
+    def python(self, interp, closure, arguments):
+        """
+        Body translated to Python, to call with the scope of closure and arguments,
+        once called more times than interp.hot. None while it isn't, or if it can't
+        be
+        """
+        if interp.hot is None:
+            return None
+
+        routine, calls, python = interp.translated.get(id(self), (self, 0, None))
+        if python is None:
+            calls += 1
+            if calls > interp.hot:
+                python = translate(self) or False
+            # the routine is kept along, so its id is not handed to another
+            interp.translated[id(self)] = (self, calls, python)
+
+        # as the interpreter would, to tell what is wrong with the call
+        if not python or not isinstance(arguments, list):
+            return None
+        if len(arguments) != len(self.signature):
+            return None
+        # it calls itself by name
+        if closure.scope[self.identifier.word] is not closure:
+            return None
+
+        return python
+
+    def call(self, closure, arguments, interp):
+        python = self.python(interp, closure, arguments)
+        if python is not None:
+            return python(closure.scope, arguments)
+        return interp.call(closure, arguments)
+
+
+class Closure:
+    """
+    A routine as its declaration binds it: along with the scope it was declared in,
+    which its calls are nested in. Every time the declaration is run binds a new
+    one. A procedure also keeps the code it was declared in and where, as a file
+    included runs on code of its own
+    """
+
+    __slots__ = ("routine", "scope", "entry")
+    category = IS_CALLABLE
+
+    def __init__(self, routine, scope, entry=None):
+        self.routine = routine
+        self.scope = scope
+        self.entry = entry
 
     def call(self, arguments, interp):
-        return interp.call(self, arguments)
+        return self.routine.call(self, arguments, interp)
+
+    def __repr__(self):
+        return "<closure %s>" % (self.routine.identifier,)
 
 
 class Exec(Keyword):
@@ -205,30 +316,29 @@ class Exec(Keyword):
 
     def parse(self, parser, **kwargs):
 
-        identifier = [parser.next()]
+        identifier = parser.next()
 
         try:
             arguments = parser.build_ast(parser.parse_expression())
         except Exception:
-            arguments = data.List()
+            arguments = None
 
-        return [self, identifier, arguments]
+        return node.Exec(self, node.Name(identifier), arguments)
 
-    def eval(self, interp, signature):
+    def eval(self, interp, statement):
 
         # get arguments if any
-        arguments = interp.eval(signature.pop()) if len(signature) > 1 else []
-
-        # get identifier from instruction line
-        identifier = interp.getval(signature.pop(), ref=True)
+        arguments = (
+            [] if statement.arguments is None else interp.eval(statement.arguments)
+        )
 
         # get procedure from scope
-        routine = interp.fetch(identifier)
+        closure = interp.fetch(statement.name.identifier)
 
-        if not isinstance(routine, Callable):
+        if not getattr(closure, "category", 0) & IS_CALLABLE:
             raise Exception("Not a callable object")
 
-        return interp.call(routine, arguments)
+        return interp.call(closure, arguments)
 
 
 class End(Keyword, Control, Delimiter):
@@ -237,26 +347,39 @@ class End(Keyword, Control, Delimiter):
         return END
 
     def parse(self, parser, **kwargs):
-        return [self]
+        return node.End(self)
 
     @staticmethod
-    def eval(interp, expr):
+    def eval(interp, statement):
 
         block = interp.get_block()
 
-        if isinstance(block, If):
-            interp.endif()
-
-        elif isinstance(block, For):
-            interp.end_for(block)
-
-        elif isinstance(block, Procedure):
-            interp.end_call()
+        try:
+            close = End.closes[block.kind]
+        except KeyError:
+            close = End.close(type(block))
 
-        elif isinstance(block, Def):
-            interp.end_call()
+        close(interp, block)
 
-        elif isinstance(block, Main):
-            interp.terminate()
-        else:
-            raise Exception("Unknown block type")
+    @staticmethod
+    def close(cls):
+        """
+        How the end of a block of a class closes it, as it does for the nearest base
+        with a kind of its own in closes. Kept for the class from then on
+        """
+        for base in cls.__mro__:
+            close = End.closes.get(getattr(base, "kind", None))
+            if close is not None:
+                End.closes[cls.kind] = close
+                return close
+        raise Exception("Unknown block type")
+
+
+# how the end of each kind of block is handled
+End.closes = {
+    If.kind: lambda interp, block: interp.endif(),
+    Loop.kind: lambda interp, block: interp.end_for(block),
+    Procedure.kind: lambda interp, block: interp.end_call(),
+    Def.kind: lambda interp, block: interp.end_call(),
+    Main.kind: lambda interp, block: interp.terminate(),
+}
@@ -1,7 +1,10 @@
-from src.lang.base import LIST, Lexeme, STRUCT, CONST
+from src.lang.base import LIST, Lexeme, STRUCT, CONST, IS_CONSTANT, IS_VECTOR
+from src.lexer import Token
 
 
 class Constant(Lexeme):
+    category = IS_CONSTANT
+
     @staticmethod
     def type():
         return CONST
@@ -17,6 +20,9 @@ class String(str, Constant):
     def __new__(cls, token, **kwargs):
         return str.__new__(cls, token.word)
 
+    def __getnewargs__(self):
+        return (Token(self.word),)
+
     def eval(self):
         return str(self)
 
@@ -28,6 +34,9 @@ class Float(float, Constant):
     def __new__(cls, token, **kwargs):
         return float.__new__(cls, token.word)
 
+    def __getnewargs__(self):
+        return (Token(self.word),)
+
     def eval(self):
         return self
 
@@ -39,6 +48,9 @@ class Integer(int, Constant):
     def __new__(cls, token, **kwargs):
         return int.__new__(cls, token.word)
 
+    def __getnewargs__(self):
+        return (Token(self.word),)
+
     def eval(self):
         return self
 
@@ -58,6 +70,8 @@ class Bool(Constant):
 
 
 class Vector(Lexeme):
+    category = IS_VECTOR
+
     @staticmethod
     def type():
         return STRUCT
@@ -76,10 +90,9 @@ class List(list, Vector):
 
     def __getitem__(self, item):
         result = list.__getitem__(self, item)
-        try:
-            return List(result)
-        except TypeError:
-            return result
+        # slices and nested lists come back as lists of the language. Only lists,
+        # as any falsy item would make an empty one
+        return List(result) if isinstance(result, list) else result
 
     def eval(self):
         return self
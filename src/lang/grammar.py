@@ -7,6 +7,8 @@ from src.lang.base import (
     COMMA,
     EXPRESSION,
     INCLUDE,
+    IS_PARAMETER,
+    IS_PREPROCESSOR,
     OP,
     PARAMETER,
     PRNT,
@@ -23,9 +25,88 @@ from src.lang.base import (
     SingleQuote,
 )
 
+from src import node
 from src.lang import control
 from src.lang import data
 from src.lang import operator as op
+from src.lexer import SymbolTable
+
+
+class GrammarTable:
+    """
+    A grammar tree compiled into a transition table over lexeme kinds.
+
+    Every node of the tree becomes an integer state, rules pointing back at a node
+    sharing its state. The column of a lexeme kind is filled for every state at once
+    the first time the kind is seen, by matching its type() against the node keys in
+    the order the tree declares them. Advancing one token is then two lookups,
+    however long the sentence grows.
+    """
+
+    START = 0
+
+    # rules tree -> its compiled table, shared by every sentence of that grammar
+    compiled = {}
+
+    def __init__(self, rules):
+        # state -> rules node
+        self.rules = []
+        # state -> keys legal at that node, in declaration order
+        self.expected = []
+        # state -> [(compiled key, next state)]
+        self.keys = []
+        # state -> [next state or None, by kind]
+        self.transitions = []
+        # kind -> whether its column is filled
+        self.filled = []
+
+        self._compile(rules, {})
+
+    @classmethod
+    def of(cls, rules):
+        try:
+            return cls.compiled[id(rules)]
+        except KeyError:
+            table = cls.compiled[id(rules)] = cls(rules)
+            return table
+
+    def _compile(self, node, states):
+        node = node() if callable(node) else node
+        if id(node) in states:
+            return states[id(node)]
+
+        state = states[id(node)] = len(self.rules)
+        self.rules.append(node)
+        self.expected.append(tuple(node))
+        self.keys.append([])
+        self.transitions.append([])
+
+        for key in node:
+            self.keys[state].append((re.compile(key), self._compile(node[key], states)))
+
+        return state
+
+    def _fill(self, kind, type):
+        grow = kind + 1 - len(self.filled)
+        if grow > 0:
+            self.filled.extend([False] * grow)
+            for transitions in self.transitions:
+                transitions.extend([None] * grow)
+
+        for state, keys in enumerate(self.keys):
+            target = next((t for key, t in keys if key.match(type)), None)
+            self.transitions[state][kind] = target
+
+        self.filled[kind] = True
+
+    def step(self, state, lexeme):
+        """
+        State reached after reading lexeme. None if it is not legal there
+        """
+        kind = lexeme.kind
+        if kind >= len(self.filled) or not self.filled[kind]:
+            self._fill(kind, lexeme.type())
+        return self.transitions[state][kind]
 
 
 # 	TODO
@@ -34,6 +115,10 @@ from src.lang import operator as op
 
 
 class Lang:
+    # version of the language and of the trees built out of it. Programs compiled
+    # to disk under another version are parsed again
+    version = 4
+
     delimiters = r"[\"\':!,;+*^&@#$%&\-\\/\|=$()?<>\s\[\]]"
 
     r_space = r"[ ]"
@@ -175,6 +260,8 @@ class Lang:
         Lang.keywords["keyword"] = lambda t: cls(t)
 
     class Parameter(Lexeme):
+        category = IS_PARAMETER
+
         def __init__(self, *args, **kwargs):
             super().__init__(*args, **kwargs)
 
@@ -204,9 +291,9 @@ class Lang:
         def parse(self, parser, **kwargs):
             self.condition = parser.build_ast(parser.parse_expression())
             self.until = parser.build_ast(parser.clause(Lang.Until))
-            return [self, self.condition, self.until]
+            return node.Wait(self, self.condition, self.until)
 
-        def eval(self, interp, expression):
+        def eval(self, interp, statement):
             c = interp.eval(self.condition)
             u = interp.eval(self.until)
             print("WAITING %s UNTIL %s" % (c, u))
@@ -221,17 +308,10 @@ class Lang:
 
         def parse(self, parser, **kwargs):
             self.text = parser.build_ast(parser.parse_expression())
-            return [self, self.text]
-
-        def eval(self, interp, expression):
-            result = interp.eval(expression)
-            while isinstance(result, list) and len(result) == 1:
-                result = result[0]
+            return node.Prnt(self, self.text)
 
-            if isinstance(result, Identifier):
-                result = interp.eval(result)
-
-            print(result)
+        def eval(self, interp, statement):
+            print(interp.eval(statement.value))
 
         def __repr__(self):
             return PRNT
@@ -242,7 +322,7 @@ class Lang:
     """
 
     class Preprocessor(Lexeme):
-        pass
+        category = IS_PREPROCESSOR
 
     class CommentBlock(Preprocessor, Delimiter):
         pass
@@ -256,17 +336,18 @@ class Lang:
             return INCLUDE
 
         def parse(self, parser, **kwargs):
-            src = parser.parse_expression()
-            return [self, src]
+            src = parser.build_ast(parser.parse_expression())
+            return node.Include(self, src)
 
-        def eval(self, interp, source):
-            print(source)
-            exit(1)
+        def eval(self, interp, statement):
+            return interp.include(interp.eval(statement.source))
 
     class Grammar(list):
         def __init__(self, rules):
             self.grammar = rules
             self.legal = rules
+            self.table = GrammarTable.of(rules)
+            self.state = GrammarTable.START
             super().__init__()
 
         # does lexeme belong to this grammar
@@ -284,18 +365,12 @@ class Lang:
 
         @staticmethod
         def is_legal(s, grammar):
-            rules = grammar
+            table = GrammarTable.of(grammar)
+            state = GrammarTable.START
             # iterate through words in sentence
             for i in s:
-                # iterate through currently legal words
-                found = False
-                for r in rules:
-                    if re.match(r, i.type()):
-                        rules = rules[r] if not callable(rules[r]) else rules[r]()
-                        found = True
-                        break
-
-                if not found:
+                state = table.step(state, i)
+                if state is None:
                     return False
             return True
 
@@ -303,28 +378,24 @@ class Lang:
             if self.legal is None:
                 return None
             else:
-                return self.legal.keys()
+                return self.table.expected[self.state]
 
         def can_push(self, i):
-            # iterate through currently legal words
-            for r in self.legal:
-                if re.match(r, i.type()):
-                    return r
-            return False
+            # the rule the word matches, if any
+            target = self.table.step(self.state, i)
+            return False if target is None else self.table.rules[target]
 
         def push(self, i):
             # if instruction begins, legal should point to all instruction set
             if len(self) == 0:
-                self.legal = self.grammar
+                self.state = GrammarTable.START
 
-            ll = self.can_push(i)
-            # print('Is legal %s? %s %s %s' % (self.__class__.__name__, i.type(), self.hint(), l))
+            target = self.table.step(self.state, i)
             # push term
-            if ll:
+            if target is not None:
                 # climb up in grammar tree
-                self.legal = (
-                    self.legal[ll] if not callable(self.legal[ll]) else self.legal[ll]()
-                )
+                self.state = target
+                self.legal = self.table.rules[target]
                 super().append(i)
                 return self
 
@@ -332,6 +403,9 @@ class Lang:
             return False
 
     class Clause(Grammar):
+        def __init__(self, rules=None):
+            super().__init__(Lang.clause if rules is None else rules)
+
         @staticmethod
         def type():
             return CLAUSE
@@ -342,3 +416,9 @@ class Lang:
 
         def type(self):
             return EXPRESSION
+
+
+# compiled once per process, shared by every lexer reading this language
+Lang.symbol_table = SymbolTable(Lang.symbols)
+Lang.expression_table = GrammarTable.of(Lang.expression)
+Lang.clause_table = GrammarTable.of(Lang.clause)
@@ -1,9 +1,20 @@
 from abc import ABC
 
-from src.lang.base import Lexeme, OP, UNARY_OP, UNARY_POST_OP
+from src.lang.base import (
+    Lexeme,
+    OP,
+    UNARY_OP,
+    UNARY_POST_OP,
+    IS_ASSIGN,
+    IS_OPERATOR,
+    IS_UNARY_OP,
+    IS_UNARY_POST_OP,
+)
 
 
 class Operator(Lexeme, ABC):
+    category = IS_OPERATOR
+
     @staticmethod
     def type():
         return OP
@@ -16,6 +27,8 @@ class Operator(Lexeme, ABC):
 
 
 class UnaryOperator(Operator, ABC):
+    category = IS_UNARY_OP
+
     @staticmethod
     def type():
         return UNARY_OP
@@ -33,6 +46,8 @@ class Not(UnaryOperator):
 
 
 class UnaryPostOperator(Operator, ABC):
+    category = IS_UNARY_POST_OP
+
     @staticmethod
     def type():
         return UNARY_POST_OP
@@ -57,6 +72,8 @@ class Decrement(UnaryPostOperator):
 
 
 class Assign(Operator):
+    category = IS_ASSIGN
+
     def eval(self, left, right, heap):
         heap[left.word] = right
         return left
@@ -133,3 +150,36 @@ class Divide(Operator):
 class Multiply(Operator):
     def eval(self, left, right, scope):
         return left * right
+
+
+LEFT = "left"
+RIGHT = "right"
+
+# precedence and associativity of every operator. Higher binds tighter
+PRECEDENCE = {
+    Assign: (1, RIGHT),
+    Or: (2, LEFT),
+    Nor: (2, LEFT),
+    Xor: (2, LEFT),
+    And: (3, LEFT),
+    Nand: (3, LEFT),
+    Not: (4, RIGHT),
+    Equal: (5, LEFT),
+    Unequal: (5, LEFT),
+    EqualStrict: (5, LEFT),
+    UnequalStrict: (5, LEFT),
+    Greater: (5, LEFT),
+    Lesser: (5, LEFT),
+    Add: (6, LEFT),
+    Subtract: (6, LEFT),
+    Multiply: (7, LEFT),
+    Divide: (7, LEFT),
+    Increment: (8, LEFT),
+    Decrement: (8, LEFT),
+}
+
+# operator kind -> how tightly it holds the term on its left, and the one on its right
+BINDING = {
+    cls.kind: (2 * p, 2 * p + 1 if associativity == LEFT else 2 * p)
+    for cls, (p, associativity) in PRECEDENCE.items()
+}
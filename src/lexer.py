@@ -1,14 +1,63 @@
-import os
+import mmap
 import re
-from io import BytesIO
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_right
+from functools import lru_cache
 
 
-class Token:
-    def __init__(self, word, line, char, byte):
+class Position:
+    """
+    Line and char of a byte offset in the source. Unless given, they are resolved
+    from the source line index the first time they are read
+    """
+
+    def place(self, other):
+        """
+        Take the position of another token or lexeme
+        """
+        self.byte = other.byte
+        self.lines = other.lines
+        self._line = other._line
+        self._char = other._char
+        return self
+
+    def _resolve(self):
+        # follow the edits made to the source since this was scanned
+        self.lines, self.byte = self.lines.follow(self.byte)
+        self._line, self._char = self.lines.position(self.byte)
+
+    def _stale(self):
+        return self.lines is not None and self.lines.moved is not None
+
+    @property
+    def line(self):
+        if self._line is None or self._stale():
+            self._resolve()
+        return self._line
+
+    @line.setter
+    def line(self, line):
+        self._line = line
+
+    @property
+    def char(self):
+        if self._char is None or self._stale():
+            self._resolve()
+        return self._char
+
+    @char.setter
+    def char(self, char):
+        self._char = char
+
+
+class Token(Position):
+    def __init__(self, word, line=None, char=None, byte=0, lines=None):
         self.word = word
-        self.line = line
-        self.char = char
         self.byte = byte
+        self.lines = lines
+        self._line = line
+        self._char = char
 
     def __eq__(self, other):
         return all(
@@ -21,171 +70,725 @@ class Token:
         )
 
 
+class LineIndex:
+    """
+    Byte offsets where source lines start. Newlines are searched for lazily, only as
+    far as the positions asked for, so a mapped file is not read in whole. A mapped
+    file cut short since is checked for before reading it, as reading pages past
+    its end kills the process. Positions are then an error, rather than a crash
+    """
+
+    # bytes searched for newlines at least, each time the index falls behind
+    SPAN = 1 << 16
+    # memory map backing the source, when it is a file
+    map = None
+
+    def __init__(self, src, newline):
+        self.src = src
+        if isinstance(src, memoryview) and isinstance(src.obj, mmap.mmap):
+            self.map = src.obj
+        # absolute offset of src. Moves along with a stream window
+        self.base = 0
+        self.newline = re.compile(newline.encode("utf-8"))
+        self.starts = array("Q", [0])
+        self.scanned = 0
+        # last position resolved, to carry on from it along the same line
+        self.last = (0, 0)
+        # edit replacing this source: start, end, size delta and index of the result
+        self.moved = None
+
+    def forward(self, start, end, delta, lines):
+        """
+        Send positions on to the index of an edited copy of the source
+        """
+        self.moved = (start, end, delta, lines)
+
+    def follow(self, byte):
+        """
+        Index of the latest edited source and where a byte offset ended up in it
+        """
+        lines = self
+        while lines.moved is not None:
+            start, end, delta, lines = lines.moved
+            if byte >= end:
+                byte += delta
+            elif byte > start:
+                # the byte itself was replaced
+                byte = start
+
+        return lines, byte
+
+    def _read(self, end):
+        """
+        Check the source still holds bytes up to end
+        """
+        if self.map is not None and self.map.size() < end - self.base:
+            raise Exception("Source file changed since it was read")
+
+    def _scan(self, until):
+        end = min(max(until, self.scanned + self.SPAN), self.base + len(self.src))
+        self._read(end)
+        self.starts.extend(
+            self.base + m.end()
+            for m in self.newline.finditer(
+                self.src, self.scanned - self.base, end - self.base
+            )
+        )
+        self.scanned = max(end, self.scanned)
+
+    def _chars(self, start, end):
+        self._read(end)
+        return len(bytes(self.src[start - self.base : end - self.base]).decode("utf-8"))
+
+    def line_start(self, byte):
+        """
+        Offset where the line holding byte starts
+        """
+        if byte > self.scanned:
+            self._scan(byte)
+        return self.starts[bisect_right(self.starts, byte) - 1]
+
+    def position(self, byte):
+        """
+        Line and char of a byte offset
+        """
+        if byte > self.scanned:
+            self._scan(byte)
+
+        line = bisect_right(self.starts, byte) - 1
+        start = self.starts[line]
+        last_byte, last_char = self.last
+
+        if start <= last_byte <= byte:
+            char = last_char + self._chars(last_byte, byte)
+        else:
+            char = self._chars(start, byte)
+
+        self.last = (byte, char)
+        return line, char
+
+
+class SpanIndex(LineIndex):
+    """
+    Line index of a copy of part of a source, taken at the offset, line and char it
+    lies at in the source. Positions are resolved from the copy alone, until the
+    source is edited. From then on they follow the edits, as the source's own do
+    """
+
+    def __init__(self, src, lines, base, position):
+        self.src = src
+        self.base = base
+        self.newline = lines.newline
+        self.starts = array("Q", [base])
+        self.scanned = base
+        self.last = (base, 0)
+        # index of the source, and the line and char the copy starts at
+        self.lines = lines
+        self.line, self.char = position
+
+    @property
+    def moved(self):
+        return self.lines.moved
+
+    def position(self, byte):
+        line, char = super().position(byte)
+        return self.line + line, char + self.char if line == 0 else char
+
+
+@lru_cache(maxsize=None)
+def compile_scanner(delimiters, newline):
+    """
+    Build the master pattern splitting source into words. Every match is either a
+    newline, any other single delimiter or a run of non-delimiter bytes
+    """
+    if (
+        delimiters.startswith("[")
+        and delimiters.endswith("]")
+        and not delimiters.startswith("[^")
+    ):
+        # negate the character class, which is much cheaper than a lookahead per byte
+        word = "[^" + delimiters[1:] + "+"
+    else:
+        word = "(?:(?!" + delimiters + ").)+"
+
+    pattern = f"(?P<newline>{newline})|(?P<delimiter>{delimiters})|(?P<word>{word})"
+    return re.compile(pattern.encode("utf-8"), re.DOTALL)
+
+
+@lru_cache(maxsize=None)
+def compile_terminator(terminator):
+    return re.compile(terminator.encode("utf-8"))
+
+
+class SymbolTable:
+    """
+    A symbol tree compiled into a deterministic transition table.
+
+    Every node of the tree becomes an integer state. Leaving a state costs a single
+    match of the word against the alternation of the node's keys, tried in the same
+    order the tree declares them. Resolved transitions are cached per state, so
+    frequent words are looked up instead of matched.
+    """
+
+    START = 0
+    CACHE_SIZE = 4096
+
+    def __init__(self, symbols):
+        # state -> compiled alternation of the node keys
+        self.patterns = []
+        # state -> {group index: next state}
+        self.targets = []
+        # state -> lexeme factory for the words collected so far
+        self.accept = []
+        # state -> whether no further word can be appended
+        self.final = []
+        # state -> {word: next state}
+        self.cache = []
+
+        self._compile(symbols)
+
+    @staticmethod
+    def _scoped(regexp):
+        # global inline flags are only allowed at the start of a whole pattern
+        m = re.match(r"^\(\?([aiLmsux]+)\)", regexp)
+        return f"(?{m.group(1)}:{regexp[m.end():]})" if m else regexp
+
+    def _compile(self, node):
+        state = len(self.patterns)
+        self.patterns.append(None)
+        self.targets.append({})
+        self.cache.append({})
+
+        if callable(node):
+            self.accept.append(node)
+            self.final.append(True)
+            return state
+
+        keys = [k for k in node if k is not None]
+        self.accept.append(node.get(None, None))
+        self.final.append(len(keys) == 0)
+
+        if len(keys) == 0:
+            return state
+
+        alternatives = []
+        group = 1
+        for key in keys:
+            alternatives.append(f"({self._scoped(key)})")
+            self.targets[state][group] = self._compile(node[key])
+            group += re.compile(key).groups + 1
+
+        self.patterns[state] = re.compile("|".join(alternatives))
+        return state
+
+    def step(self, state, word):
+        """
+        State reached after reading word. None if the word leads nowhere
+        """
+        cache = self.cache[state]
+        try:
+            return cache[word]
+        except KeyError:
+            pass
+
+        pattern = self.patterns[state]
+        m = pattern.match(word) if pattern is not None else None
+        target = self.targets[state][m.lastindex] if m else None
+
+        if len(cache) < self.CACHE_SIZE:
+            cache[word] = target
+
+        return target
+
+
 class Lexer:
     """
     Spit out tokens
     """
 
-    def __init__(self, syntax, source, is_file=False):
+    # consumed bytes a stream window may hold before being trimmed
+    WINDOW_SIZE = 1 << 16
+    # smallest piece of source worth lexing in a process of its own
+    PARALLEL_CHUNK = 1 << 20
+
+    def __init__(self, syntax, source, is_file=False, is_stream=False):
 
         self.syntax = syntax
-        self.chars = []
-        self.num_line = 0
-        self.num_char = 0
-        self.src = None
+        self.scanner = compile_scanner(syntax.delimiters, syntax.r_newline)
+        self.pos = 0
+        # a word scanned ahead that didn't belong to the previous symbol
+        self.lookahead = None
+
+        # memory map backing the source, when read from a file
+        self.map = None
+        self.filename = source if is_file else None
+        # pending chunks and absolute offset of the window, when read from a stream
+        self.chunks = None
+        self.base = 0
 
         if is_file:
-            with open(source, "rb") as f:
-                self.src = BytesIO(f.read())
+            self.src = self._map(source)
+        elif is_stream:
+            self.src = bytearray()
+            self.chunks = iter(source)
+        elif isinstance(source, str):
+            self.src = source.encode("utf-8")
         else:
-            if source is None:
-                self.src = BytesIO(b"")
-            else:
-                self.src = BytesIO(source.encode("utf-8"))
-
-    def __exit__(self):
-        self.src.close()
-
-    def _backtrack(self, n=1):
-        self.src.seek(-n, os.SEEK_CUR)
+            self.src = b"" if source is None else source
+
+        self.lines = LineIndex(self.src, syntax.r_newline)
+
+    def _map(self, filename):
+        """
+        Map a source file into memory. Words are matched straight on the mapped pages,
+        so only the pages already scanned are ever read in
+        """
+        with open(filename, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped
+                return b""
+
+        return memoryview(self.map)
+
+    def _fill(self):
+        """
+        Append the next chunk of a stream to the window, dropping what was already
+        scanned. False once the stream is exhausted
+        """
+        if self.chunks is None:
+            return False
+
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.chunks = None
+            return False
+
+        # keep the current line, which positions are still resolved against
+        keep = self.lines.line_start(self.pos)
+        if keep - self.base > self.WINDOW_SIZE:
+            del self.src[: keep - self.base]
+            self.base = self.lines.base = keep
+
+        self.src += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        return True
+
+    def close(self):
+        """
+        Drop the source. A mapped file is unmapped once no lexeme refers to it anymore.
+        Until then, lexemes resolve their positions against it as it is on disk
+        """
+        self.map = None
+        self.src = b""
+
+    def seek(self, byte):
+        """
+        Go to a byte offset, which should be the start of a word
+        """
+        self.pos = byte
+        self.lookahead = None
         return self
 
-    def _is_newline(self, char):
-        return bool(re.match(self.syntax.r_newline, char))
+    def edit(self, start, end, text):
+        """
+        A lexer over a copy of the source with bytes start to end replaced by text
+        """
+        if self.chunks is not None or self.base > 0:
+            raise Exception("Cannot edit a streamed source")
 
-    def _track_line_and_char(self, char, word):
-        # char is newline
-        if self._is_newline(char) and char == word:
-            self.num_char = 0
-            self.num_line += 1
-        else:
-            self.num_char += len(word)
+        src = bytes(self.src[:start]) + text.encode("utf-8") + bytes(self.src[end:])
+        return Lexer(self.syntax, src)
 
-    def _scan(self):
+    def tell(self):
+        """
+        Byte offset of the next word to scan
+        """
+        return self.lookahead.byte if self.lookahead is not None else self.pos
 
-        if self.src.closed:
-            # already at EOF
-            return None
+    def position(self):
+        """
+        Line and char of the next word to scan
+        """
+        return self.lines.position(self.tell())
 
-        self.chars = []
-        char = ""
-        start_byte = self.src.tell()
+    def _is_newline(self, char):
+        return bool(re.match(self.syntax.r_newline, char))
+
+    def _restart(self, start, byte):
+        # a word after whitespace always starts a symbol of its own. Look for one
+        # shortly before byte, or fall back to start
+        window = bytes(self.src[max(start, byte - 64) - self.base : byte - self.base])
+        cut = max(window.rfind(b" "), window.rfind(b"\t"), window.rfind(b"\n"))
+        return byte - len(window) + cut + 1 if cut >= 0 else start
+
+    def raw(self, terminator, accept=None):
+        """
+        Jump straight to the next match of the terminator pattern, leaving the symbol
+        table aside. If given, accept confirms the lexeme found there is a real
+        terminator. Returns the text skipped as a single token, with the terminator
+        consumed, or None if the source ends first
+        """
+        start = self.pos = self.tell()
+        self.lookahead = None
+        pattern = compile_terminator(terminator)
+        frm = start
 
         while True:
-            # read character
-            char_bytes = self.src.read(1)
+            m = pattern.search(self.src, frm - self.base)
 
-            if not char_bytes:
+            if m is None:
+                if self._fill():
+                    # a terminator may be split by the end of the window
+                    frm = max(start, self.base + len(self.src) - 8)
+                    continue
                 # EOF
-                # self.src.close()
+                self.pos = self.base + len(self.src)
+                return None
+
+            byte = self.base + m.start()
+
+            if accept is None:
+                self.pos = self.base + m.end()
                 break
 
-            char = char_bytes.decode("utf-8")
-            c = re.match(self.syntax.delimiters, char)
+            # lex the stretch before the candidate, which may swallow part of it
+            self.seek(self._restart(start, byte))
+            while self.tell() < byte and self.next() is not False:
+                pass
 
-            # no delimiter found. Keep reading
-            if c is None:
-                self.chars.append(char)
-            else:
-                # a delimiter found. A single char to return
-                if len(self.chars) == 0:
-                    self.chars = char
-                    break
-                # a multichar token to return.
-                # backtrack 1 to leave pointer in position for next reading
-                else:
-                    self._backtrack(1)
+            if self.tell() == byte:
+                lexeme = self.next()
+                if lexeme is not False and accept(lexeme):
                     break
 
-        # return None on empty word
-        word = "".join(self.chars) if len(self.chars) > 0 else None
-        if word is None:
+            frm = self.tell()
+
+        text = bytes(self.src[start - self.base : byte - self.base]).decode("utf-8")
+        token = Token(text, byte=start, lines=self.lines)
+        if self.chunks is not None:
+            token._resolve()
+        return token
+
+    def search(self, pattern):
+        """
+        Jump past the next match of a compiled pattern, leaving the symbol table
+        aside. Returns the match, or None if the source ends first. Sources read
+        whole only
+        """
+        self.lookahead = None
+        m = pattern.search(self.src, self.pos - self.base)
+        self.pos = self.base + (len(self.src) if m is None else m.end())
+        return m
+
+    def _scan(self):
+
+        if self.lookahead is not None:
+            token, self.lookahead = self.lookahead, None
+            return token
+
+        m = self.scanner.match(self.src, self.pos - self.base)
+
+        # a word touching the end of a stream window may go on in the next chunk
+        while self.chunks is not None and (
+            m is None or m.lastgroup == "word" and m.end() == len(self.src)
+        ):
+            self._fill()
+            m = self.scanner.match(self.src, self.pos - self.base)
+
+        # EOF
+        if m is None:
             return None
 
-        # keep current values before checks for new char & line
-        num_char = self.num_char
-        num_line = self.num_line
+        token = Token(m.group().decode("utf-8"), byte=self.pos, lines=self.lines)
+        self.pos = self.base + m.end()
 
-        self._track_line_and_char(char, word)
+        # a stream window moves on. Resolve the position while its line is still in
+        if self.chunks is not None:
+            token._resolve()
 
-        return Token(word, line=num_line, char=num_char, byte=start_byte)
+        return token
 
     def next(self):
 
-        tree = self.syntax.symbols
-        tokens = []
-        queued = []
+        table = self.syntax.symbol_table
+        state = table.START
+        words = []
+        first = None
 
         while True:
-            match = None
-
-            if len(queued) > 0:
-                token = queued.pop(0)
-            else:
-                token = self._scan()
+            token = self._scan()
 
             if token is None:
-                if len(tokens) == 0:
+                # EOF
+                if first is None:
                     return False
-                else:
-                    return tree[None](
-                        Token(
-                            "".join([t.word for t in tokens]),
-                            tokens[0].line,
-                            tokens[0].char,
-                            tokens[0].byte,
-                        )
+                return table.accept[state](Token("".join(words)).place(first))
+
+            target = table.step(state, token.word)
+
+            if target is None:
+                # nothing collected. Unknown word is dropped
+                if first is None or table.accept[state] is None:
+                    continue
+
+                # word doesn't extend the symbol. Keep it for the next call
+                self.lookahead = token
+                return table.accept[state](Token("".join(words)).place(first))
+
+            if first is None:
+                first = token
+            words.append(token.word)
+            state = target
+
+            if table.final[state]:
+                # It's a terminal symbol. Wrap it up.
+                return table.accept[state](Token("".join(words)).place(first))
+
+    def _split(self, start, processes):
+        # spans of about even size, each one ending right after a newline. Nothing
+        # extends a newline, so lexing starts afresh past any of them
+        newline = compile_terminator(self.syntax.r_newline)
+        size = max(self.PARALLEL_CHUNK, (len(self.src) - start) // processes)
+        spans = []
+
+        while start < len(self.src):
+            m = newline.search(self.src, min(start + size, len(self.src)))
+            end = m.end() if m is not None else len(self.src)
+            spans.append((start, end))
+            start = end
+
+        return spans
+
+    def _tabulate_parallel(self, processes):
+        start = self.pos = self.tell()
+        self.lookahead = None
+        line, char = self.lines.position(start)
+        newline = compile_terminator(self.syntax.r_newline)
+        tokens = TokenTable(self.syntax, self.src)
+
+        with ProcessPoolExecutor(processes) as pool:
+            results = []
+            for a, b in self._split(start, processes):
+                results.append(
+                    pool.submit(
+                        tabulate_span,
+                        self.syntax,
+                        self.filename or bytes(self.src[a:b]),
+                        self.filename is not None,
+                        (a, b),
+                        (line, char),
                     )
+                )
+                # where the next span starts. Only the first one may be off a line
+                line, char = line + len(newline.findall(self.src, a, b)), 0
+
+            for result in results:
+                table = result.result()
+                tokens.kind.extend(table.kind)
+                tokens.byte.extend(table.byte)
+                tokens.length.extend(table.length)
+                tokens.line.extend(table.line)
+                tokens.char.extend(table.char)
+                tokens.end = table.end
+
+        self.pos = len(self.src)
+        return tokens
+
+    def tabulate(self, processes=1):
+        """
+        Scan the rest of the source into a TokenTable, building no lexeme at all.
+        With several processes, the source is cut at newlines and the pieces are
+        lexed in parallel
+        """
+        if self.chunks is not None or self.base > 0:
+            raise Exception("Cannot tabulate a streamed source")
+
+        if processes > 1 and len(self.src) - self.tell() > self.PARALLEL_CHUNK:
+            return self._tabulate_parallel(processes)
+
+        symbols = self.syntax.symbol_table
+        step, accept, final = symbols.step, symbols.accept, symbols.final
+        tokens = TokenTable(self.syntax, self.src)
+        match = self.scanner.match
+
+        # resume from the word scanned ahead, if any
+        pos = self.pos = self.tell()
+        self.lookahead = None
+
+        line, char = self.lines.position(pos)
+        state, first = symbols.START, None
+        m = match(self.src, pos)
+
+        while m is not None:
+            word = m.group().decode("utf-8")
+            target = step(state, word)
+
+            if target is None and first is not None and accept[state] is not None:
+                # word doesn't extend the symbol. Match it again from the start
+                tokens.append(state, first[0], pos - first[0], first[1], first[2])
+                state, first = symbols.START, None
+                continue
 
-            for regexp in [t for t in tree if t is not None]:
-                if re.match(regexp, token.word):
-                    tokens.append(token)
-                    # move forward in tree
-                    tree = tree[regexp]
-
-                    if callable(tree):
-                        # It's a terminal symbol. Wrap it up.
-                        return tree(
-                            Token(
-                                "".join([t.word for t in tokens]),
-                                tokens[0].line,
-                                tokens[0].char,
-                                tokens[0].byte,
-                            )
-                        )
-                    elif len(tree) == 1 and None in tree.keys():
-                        # Also a terminal
-                        return tree[None](
-                            Token(
-                                "".join([t.word for t in tokens]),
-                                tokens[0].line,
-                                tokens[0].char,
-                                tokens[0].byte,
-                            )
-                        )
-
-                    match = token.word
-                    break
+            if target is not None:
+                if first is None:
+                    first = (pos, line, char)
+                state = target
 
-            if match:
-                # found something. Collected it in tokens. Get one more and try to match greedily
-                continue
+            pos = m.end()
+            if m.lastgroup == "newline":
+                line, char = line + 1, 0
+            else:
+                char += len(word)
+
+            if target is not None and final[state]:
+                tokens.append(state, first[0], pos - first[0], first[1], first[2])
+                state, first = symbols.START, None
+
+            m = match(self.src, pos)
+
+        # EOF
+        if first is not None:
+            tokens.append(state, first[0], pos - first[0], first[1], first[2])
+
+        self.pos = pos
+        tokens.end = (line, char)
+        return tokens
+
+
+def tabulate_span(syntax, source, is_file, span, position):
+    """
+    Lex a span of source into a TokenTable, given the line and char it starts at.
+    Runs in worker processes, which map source files on their own
+    """
+    start, end = span
+    line, char = position
+
+    if is_file:
+        with open(source, "rb") as f:
+            src = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        source = src[start:end]
+
+    table = Lexer(syntax, source).tabulate()
+
+    # move the span columns to where it lies in the whole source
+    table.byte = array("Q", (b + start for b in table.byte))
+    table.line = array("L", (n + line for n in table.line))
+    if char > 0:
+        table.char = array(
+            "L", (c + char if n == line else c for n, c in zip(table.line, table.char))
+        )
+    end_line, end_char = table.end
+    table.end = (end_line + line, end_char + char if end_line == 0 else end_char)
+
+    # the source stays behind. Only the columns travel back
+    table.src = b""
+    return table
+
+
+class TokenTable:
+    """
+    Tokens stored column-wise in arrays, one row per lexeme. The kind of a row is the
+    symbol table state that accepted it. Lexemes are only built when a row is read
+    """
+
+    def __init__(self, syntax, src):
+        self.syntax = syntax
+        self.src = src
+        self.kind = array("H")
+        self.byte = array("Q")
+        self.length = array("L")
+        self.line = array("L")
+        self.char = array("L")
+        # line and char past the last row
+        self.end = (0, 0)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def __getitem__(self, i):
+        return self.syntax.symbol_table.accept[self.kind[i]](self.token(i))
+
+    def append(self, kind, byte, length, line, char):
+        self.kind.append(kind)
+        self.byte.append(byte)
+        self.length.append(length)
+        self.line.append(line)
+        self.char.append(char)
+
+    def word(self, i):
+        start = self.byte[i]
+        return bytes(self.src[start : start + self.length[i]]).decode("utf-8")
+
+    def token(self, i):
+        return Token(self.word(i), self.line[i], self.char[i], self.byte[i])
+
+    def reader(self, index=0):
+        """
+        A lexer replaying the table from a row on
+        """
+        return TableLexer(self, index)
+
+
+class TableLexer:
+    """
+    Spit out tokens already stored in a TokenTable
+    """
+
+    def __init__(self, table, index=0):
+        self.table = table
+        self.index = index
 
-            elif (
-                not match
-                and len(tokens) > 0
-                and isinstance(tree, dict)
-                and None in tree.keys()
+    def position(self):
+        if self.index < len(self.table):
+            return self.table.line[self.index], self.table.char[self.index]
+        return self.table.end
+
+    def seek(self, index):
+        self.index = index
+        return self
+
+    def tell(self):
+        if self.index < len(self.table):
+            return self.table.byte[self.index]
+        return len(self.table.src)
+
+    def close(self):
+        pass
+
+    def raw(self, terminator, accept=None):
+        """
+        Skip rows up to the next terminator, as Lexer.raw does on the source
+        """
+        pattern = compile_terminator(terminator)
+        table = self.table
+        if self.index > 0:
+            # right past the opener. Rows the skipped text was split into may start
+            # further on, past whitespace, which has no rows
+            opener = self.index - 1
+            start = table.byte[opener] + table.length[opener]
+            line = table.line[opener]
+            char = table.char[opener] + len(table.word(opener))
+        else:
+            start = self.tell()
+            line, char = self.position()
+
+        while self.index < len(self.table):
+            i = self.index
+            self.index += 1
+            if pattern.fullmatch(self.table.word(i).encode("utf-8")) and (
+                accept is None or accept(self.table[i])
             ):
-                self._backtrack(len(token.word))
-                self.num_char -= len(token.word)
-                return tree[None](
-                    Token(
-                        "".join([t.word for t in tokens]),
-                        tokens[0].line,
-                        tokens[0].char,
-                        tokens[0].byte,
-                    )
-                )
-            else:
-                continue
+                byte = self.table.byte[i]
+                text = bytes(self.table.src[start:byte]).decode("utf-8")
+                return Token(text, line, char, start)
+
+        return None
+
+    def next(self):
+        if self.index >= len(self.table):
+            return False
+
+        lexeme = self.table[self.index]
+        self.index += 1
+        return lexeme
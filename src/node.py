@@ -0,0 +1,181 @@
+"""
+Syntax tree nodes built by the parser and run by the interpreter. Nodes are
+immutable, so a tree can be run any number of times
+"""
+
+from dataclasses import dataclass
+
+from src.lang.base import Identifier, Keyword, Lexeme
+from src.lang.data import Constant
+from src.lang.operator import Operator
+
+
+class Node:
+    __slots__ = ()
+
+    def operands(self):
+        """
+        Nodes evaluated before this one, in order
+        """
+        return ()
+
+    def __reduce__(self):
+        # rebuilt through the constructor, much quicker than the frozen dataclass
+        # state being set field by field
+        return type(self), tuple(getattr(self, name) for name in self.__match_args__)
+
+
+"""
+EXPRESSIONS
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class Literal(Node):
+    constant: Constant
+
+
+@dataclass(frozen=True, slots=True)
+class Name(Node):
+    identifier: Identifier
+
+
+@dataclass(frozen=True, slots=True)
+class BinOp(Node):
+    left: Node
+    operator: Operator
+    right: Node
+
+    def operands(self):
+        return self.left, self.right
+
+
+@dataclass(frozen=True, slots=True)
+class Assign(Node):
+    target: Name
+    operator: Operator
+    value: Node
+
+    def operands(self):
+        return (self.value,)
+
+
+@dataclass(frozen=True, slots=True)
+class UnaryOp(Node):
+    operator: Operator
+    operand: Node
+
+    def operands(self):
+        return (self.operand,)
+
+
+@dataclass(frozen=True, slots=True)
+class PostOp(Node):
+    operator: Operator
+    operand: Node
+
+
+@dataclass(frozen=True, slots=True)
+class ListLit(Node):
+    items: tuple
+
+    def operands(self):
+        return self.items
+
+
+@dataclass(frozen=True, slots=True)
+class Call(Node):
+    callee: Name
+    arguments: Node
+
+    def operands(self):
+        return (self.arguments,)
+
+
+@dataclass(frozen=True, slots=True)
+class Param(Node):
+    parameter: Lexeme
+    value: Node
+
+    def operands(self):
+        return (self.value,)
+
+
+"""
+STATEMENTS
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class Statement(Node):
+    keyword: Keyword
+
+
+@dataclass(frozen=True, slots=True)
+class If(Statement):
+    condition: Node
+
+
+@dataclass(frozen=True, slots=True)
+class Else(Statement):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class End(Statement):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class For(Statement):
+    init: Node
+    condition: Node
+    increment: Node
+
+
+@dataclass(frozen=True, slots=True)
+class Procedure(Statement):
+    name: Name
+    signature: tuple
+
+
+@dataclass(frozen=True, slots=True)
+class Def(Procedure):
+    body: tuple
+
+
+@dataclass(frozen=True, slots=True)
+class Exec(Statement):
+    name: Name
+    arguments: Node
+
+
+@dataclass(frozen=True, slots=True)
+class Prnt(Statement):
+    value: Node
+
+
+@dataclass(frozen=True, slots=True)
+class Wait(Statement):
+    condition: Node
+    until: Node
+
+
+@dataclass(frozen=True, slots=True)
+class Include(Statement):
+    source: Node
+
+
+def signature(node):
+    """
+    Identifiers of a routine signature, from a name or a list of names
+    """
+    items = node.items if isinstance(node, ListLit) else (node,)
+    names = []
+    for item in items:
+        if item is None:
+            continue
+        if not isinstance(item, Name):
+            raise Exception("Signatures take identifiers only")
+        names.append(item.identifier)
+    return tuple(names)
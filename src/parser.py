@@ -1,45 +1,95 @@
-import src.lang.data
+import re
+from functools import lru_cache
+
 from src.lang.base import (
-    Keyword,
     Lexeme,
-    Space,
-    Tab,
-    NewLine,
     Comma,
     DoubleQuote,
     SingleQuote,
     Bracket,
     Parentheses,
-    Delimiter,
-    Identifier,
+    IS_ASSIGN,
+    IS_BLANK,
+    IS_BLOCK,
+    IS_CONSTANT,
+    IS_DELIMITER,
+    IS_IDENTIFIER,
+    IS_KEYWORD,
+    IS_NEWLINE,
+    IS_OPERATOR,
+    IS_PARAMETER,
+    IS_PREPROCESSOR,
+    IS_UNARY_OP,
+    IS_UNARY_POST_OP,
 )
 from src.lang.control import Block
-from src.lang.data import Constant
-from src.lang.operator import Operator, UnaryOperator, UnaryPostOperator
 from src.lang import data
-from src.lexer import Lexer, Token
+from src.lang.operator import BINDING
+from src import node
+from src.lexer import Lexer, SpanIndex, Token
 from src.exc import UnexpectedEOF, UnexpectedSymbol
 
-
 BLOCK_MAIN = "<main>"
 
+# frames left by build_ast for what it is building
+GROUP = 0
+UNARY = 1
+BINARY = 2
+PARAMETER = 3
+
+# lexemes starting an expression statement
+EXPRESSION_START = IS_DELIMITER | IS_CONSTANT | IS_IDENTIFIER | IS_UNARY_OP
+
+
+@lru_cache(maxsize=None)
+def compile_skipper(lang):
+    """
+    Build the pattern skip_block searches for: quotes and comments, and keywords
+    opening or closing a block, standing as words of their own
+    """
+    opening, closing = [], []
+    for word, keyword in lang.keywords.items():
+        category = keyword(Token(word)).category
+        if category & IS_BLOCK:
+            opening.append(re.escape(word))
+        elif category & IS_DELIMITER:
+            closing.append(re.escape(word))
+
+    # as the lexer tells words apart
+    word = "[^" + lang.delimiters[1:]
+    pattern = (
+        f"(?P<quote>{lang.r_double_quote}|{lang.r_single_quote})"
+        f"|(?P<line>{lang.r_slash}{lang.r_slash})"
+        f"|(?P<comment>{lang.r_slash}{lang.r_asterisk})"
+        f"|(?<!{word})(?:(?P<open>{'|'.join(opening)})|(?P<close>{'|'.join(closing)}))"
+        f"(?!{word})"
+    )
+    return re.compile(pattern.encode("utf-8"))
+
 
 class Parser:
     """
     The parser
     """
 
-    def __init__(self, lang, source, is_file=False):
+    def __init__(self, lang, source, is_file=False, is_stream=False, lazy=False):
         self.count = 0
+        # leave routine bodies to be parsed when first called
+        self.lazy = lazy
         self.lang = lang
-        self.lexer = Lexer(lang, source, is_file)
+        self.lexer = Lexer(lang, source, is_file, is_stream)
         self.tree = []
         self.pending = []
         self.blocks = [BLOCK_MAIN]
         self.jump_points = []
 
-    def set_source(self, source, is_file=False):
-        self.lexer = Lexer(self.lang, source, is_file)
+    def set_source(self, source, is_file=False, is_stream=False, tabulate=False):
+        self.lexer.close()
+        self.lexer = Lexer(self.lang, source, is_file, is_stream)
+
+        # lex everything upfront into a compact table. Lexemes are built when read
+        if tabulate:
+            self.lexer = self.lexer.tabulate().reader()
 
     def _EOF(self):
         if len(self.blocks) > 1:
@@ -49,24 +99,24 @@ class Parser:
 
         return False
 
-    @staticmethod
-    def _unnest(s, stop):
-        n = []
-        while True and len(s) > 0:
-            i = s.pop(-1)
-            if isinstance(i, stop):
-                break
-            else:
-                n.insert(0, i)
-
-        return s, n
+    def tell(self):
+        """
+        Byte offset of the next lexeme to parse
+        """
+        return self.pending[-1].byte if len(self.pending) > 0 else self.lexer.tell()
+
+    def seek(self, byte, count=0):
+        """
+        Resume parsing at the start of a top-level statement
+        """
+        self.lexer.seek(byte)
+        self.pending = []
+        self.blocks = [BLOCK_MAIN]
+        self.count = count
 
     def get_position(self):
-        return {
-            "line": self.lexer.num_line,
-            "char": self.lexer.num_char,
-            "byte": self.lexer.src.tell(),
-        }
+        line, char = self.lexer.position()
+        return {"line": line, "char": char, "byte": self.lexer.tell()}
 
     def push_block(self, block):
         self.blocks.append(block)
@@ -86,40 +136,8 @@ class Parser:
                 elif isinstance(block, needle):
                     return block
 
-    def _verbatim(self, stop, **kwargs):
-        verbatim = []
-
-        while True:
-            lexeme = self.lexer.next()
-
-            # EOF
-            if not lexeme or lexeme is None:
-                break
-
-            # is lexeme the stop token?
-            if isinstance(lexeme, stop):
-                found = True
-                # has lexeme the properties we are looking for?
-                for p in kwargs:
-                    # it doesn't
-                    if p not in lexeme.__dict__:
-                        found = False
-                    # has property but different value?
-                    elif kwargs[p] != lexeme.__dict__[p]:
-                        found = False
-                        # reject lexeme as the stop mark
-                        break
-                if found:
-                    return "".join(verbatim)
-            else:
-                verbatim.append(lexeme.word)
-
-        return False
-
     def next(self, ignore=None) -> Lexeme | bool:
 
-        ignore = (Space, Tab) if ignore is None else ignore
-
         while True:
             lexeme = self.pending.pop() if len(self.pending) > 0 else self.lexer.next()
 
@@ -127,47 +145,83 @@ class Parser:
             if lexeme is False:
                 return False
 
+            category = lexeme.category
+
             # preprocessor directives
-            if isinstance(lexeme, self.lang.Preprocessor):
-                if isinstance(lexeme, self.lang.CommentLine):
+            if category & IS_PREPROCESSOR:
+                if lexeme.kind == self.lang.CommentLine.kind:
                     # skips until newline
-                    self._verbatim(NewLine)
+                    self.lexer.raw(self.lang.r_newline)
                     continue
 
-                if isinstance(lexeme, self.lang.CommentBlock):
-                    # skips until closed comment block
-                    self._verbatim(self.lang.CommentBlock, open=False)
+                if lexeme.kind == self.lang.CommentBlock.kind:
+                    self.skip_comment()
                     continue
 
-            if isinstance(lexeme, ignore):
+            # spaces and tabs, unless told otherwise
+            if category & IS_BLANK if ignore is None else isinstance(lexeme, ignore):
                 continue
 
             break
 
         return lexeme
 
+    def skip_comment(self):
+        """
+        Skip until the comment block open is closed
+        """
+        self.lexer.raw(
+            self.lang.r_asterisk + self.lang.r_slash,
+            lambda i: isinstance(i, self.lang.CommentBlock) and not i.open,
+        )
+
     def list(self, s):
+        return self._list(s, 0, len(s))[0]
+
+    def _list(self, s, pos, end):
+        """
+        Items up to the bracket closing the list, split on commas. Returns the
+        list along with the position following it
+        """
+        # lists still open around the current one
+        outer = []
         ll = []
         e = []
-        while True and len(s) > 0:
-            i = s.pop(0)
-            if isinstance(i, Comma):
+        while pos < end:
+            i = s[pos]
+            pos += 1
+            kind = getattr(i, "kind", None)
+            if kind == Comma.kind:
                 ll.append(e)
                 e = []
                 continue
-            elif isinstance(i, Bracket):
-                if i.open:
-                    e = self.list(s)
-                else:
-                    if len(e) > 0:
-                        ll.append(e)
-                    return ll
+            elif kind == Bracket.kind:
+                outer.append((ll, e))
+                ll = []
+                e = []
+            elif kind == Bracket.closed:
+                if len(e) > 0:
+                    ll.append(e)
+                if len(outer) == 0:
+                    return self._list_node(ll), pos
+                # a nested list is an item of the one around it
+                nested = self._list_node(ll)
+                ll, e = outer.pop()
+                e.append(nested)
             else:
                 e.append(i)
 
-        ll.append(e)
+        # close whatever is left open
+        while True:
+            ll.append(e)
+            if len(outer) == 0:
+                return self._list_node(ll), pos
+            nested = self._list_node(ll)
+            ll, e = outer.pop()
+            e.append(nested)
 
-        return ll
+    def _list_node(self, ll):
+        return node.ListLit(tuple(self.build_ast(e) for e in ll))
 
     def parse_block(self, until=None, leave=False):
 
@@ -197,6 +251,66 @@ class Parser:
             else:
                 block.append(i)
 
+    def skip_block(self):
+        """
+        Skip past the end closing the block open, nested blocks included. Only block
+        keywords, quotes and comments are searched for, nothing is lexed in between.
+        Returns a copy of the body up to its end included, as a mapped source may
+        change under it, indexed as it lies in source
+        """
+        start = self.tell()
+        self.lexer.seek(start)
+        self.pending = []
+        pattern = compile_skipper(self.lang)
+        depth = 0
+
+        while True:
+            m = self.lexer.search(pattern)
+
+            if m is None:
+                raise UnexpectedEOF(f"Unexpected EOF at block from byte {start}")
+
+            found = m.lastgroup
+
+            # an end quoted or commented out is not one
+            if found == "quote":
+                quote = self.lang.r_double_quote
+                if m.group() != b'"':
+                    quote = self.lang.r_single_quote
+                if self.lexer.raw(quote) is None:
+                    raise UnexpectedEOF(f"Unterminated string at byte {m.start()}")
+            elif found == "line":
+                self.lexer.raw(self.lang.r_newline)
+            elif found == "comment":
+                self.skip_comment()
+            elif found == "open":
+                depth += 1
+            elif depth > 0:
+                depth -= 1
+            else:
+                lexer = self.lexer
+                body = bytes(lexer.src[start - lexer.base : m.end()])
+                lines = lexer.lines
+                return SpanIndex(body, lines, start, lines.position(start))
+
+    def statement(self):
+        """
+        Parse and build a complete top-level statement, nested blocks included.
+        Returns its instructions or False on EOF
+        """
+        instructions = []
+
+        while True:
+            instr = self.parse()
+
+            if instr is False or instr is None:
+                return instructions if len(instructions) > 0 else False
+
+            instructions.append(self.build_ast(instr))
+
+            if len(self.blocks) == 1:
+                return instructions
+
     def parse_expression(self, until=None):
         # Collects tokens belonging to an expression.
         # It expects an expression and would fail on tokens unexpected on an expression
@@ -215,7 +329,7 @@ class Parser:
                     return False
 
             # commit parse_expression on newline
-            if isinstance(lexeme, NewLine):
+            if lexeme.category & IS_NEWLINE:
                 return expression
 
             if until is not None and isinstance(lexeme, until):
@@ -224,21 +338,21 @@ class Parser:
             # literals
             if isinstance(lexeme, (DoubleQuote, SingleQuote)):
                 if isinstance(lexeme, DoubleQuote):
-                    word = self._verbatim(DoubleQuote)
+                    body = self.lexer.raw(self.lang.r_double_quote)
                 else:
-                    word = self._verbatim(SingleQuote)
+                    body = self.lexer.raw(self.lang.r_single_quote)
+
+                if body is None:
+                    raise UnexpectedEOF(
+                        f"Unterminated string at ({lexeme.line}:{lexeme.char})"
+                    )
 
-                ll = data.String(Token(word, lexeme.line, lexeme.char, lexeme.byte))
+                ll = data.String(Token(body.word).place(lexeme))
                 expression.push(ll)
                 continue
 
-            if self.lang.Grammar.is_legal(expression + [lexeme], self.lang.expression):
-                expression.push(lexeme)
-            else:
-                raise UnexpectedSymbol(
-                    f'Unexpected "{lexeme.word}" at ({lexeme.line}:{lexeme.char}). '
-                    f"Expecting: {', '.join(expression.hint())}"
-                )
+            if not expression.push(lexeme):
+                raise UnexpectedSymbol(lexeme, expression.hint())
 
         return expression
 
@@ -277,11 +391,13 @@ class Parser:
         if until is not None and isinstance(lexeme, until):
             return lexeme
 
-        if isinstance(lexeme, Keyword):
-            if isinstance(lexeme, Block):
+        category = lexeme.category
+
+        if category & IS_KEYWORD:
+            if category & IS_BLOCK:
                 self.push_block((self.count, lexeme))
 
-            elif isinstance(lexeme, Delimiter):
+            elif category & IS_DELIMITER:
                 p0, b = self.pull_block()
                 lexeme.owner, b.length = (b, self.count - p0 - 1)
 
@@ -289,68 +405,176 @@ class Parser:
             self.count += 1
             return lexeme.parse(self)
 
-        elif isinstance(lexeme, (Delimiter, Constant, Identifier, UnaryOperator)):
+        elif category & EXPRESSION_START:
             self.pending.append(lexeme)
 
             # add to instruction counter
             self.count += 1
             return self.parse_expression()
-        elif isinstance(lexeme, self.lang.Parameter):
+        elif category & IS_PARAMETER:
             raise Exception("Misplaced parameter")
         else:
             # newline, tab & beyond
             return self.parse(until=until)
 
     def build_ast(self, s):
-
-        # n as the node we are building
-        n = []
-
-        # get rid of superfluous nesting
-        if isinstance(s, list) and len(s) == 1 and isinstance(s[0], list):
-            s = s.pop()
-
-        while s and len(s) > 0:
-            i = s.pop(0)
-            # parentheses grouping
-            if isinstance(i, Parentheses):
-                if i.open:
-                    # n is the i(n)ner node while s is the remaining (i)nstruction
-                    n, s = self._unnest(s, Parentheses)
-                    if len(n) > 0:
-                        n = self.build_ast(n)
-                else:
+        """
+        Build the syntax tree of an expression by precedence climbing. Statements
+        come out of parse() built already. Empty expressions build to None
+        """
+        if isinstance(s, node.Node):
+            return s
+
+        if not s:
+            return None
+
+        # where every parentheses group ends. Groups left open run to the end
+        ends = {}
+        opened = []
+        for k, i in enumerate(s):
+            kind = getattr(i, "kind", None)
+            if kind == Parentheses.kind:
+                opened.append(k)
+            elif kind == Parentheses.closed:
+                if len(opened) == 0:
                     raise Exception("Unexpected parentheses at %s" % i.line)
+                ends[opened.pop()] = k
+        for k in opened:
+            ends[k] = len(s)
+
+        return self._build(s, len(s), ends)
+
+    def _build(self, s, end, ends):
+        """
+        Precedence climbing over an explicit stack, so nesting is only limited by
+        memory. Every group or operand being built leaves a frame with what it
+        completes once done
+        """
+        stack = []
+        pos, power, n = 0, 0, []
+        # collecting the terms of an operand, or else operators following it
+        terms = True
 
-            # list without brackets. Like arguments list
-            elif isinstance(i, Comma):
-                return src.lang.data.List(self.list(n + [i] + s))
+        while True:
+            if terms:
+                if pos < end:
+                    i = s[pos]
+                    kind = getattr(i, "kind", None)
+                    category = getattr(i, "category", 0)
+
+                    # parentheses grouping
+                    if kind == Parentheses.kind:
+                        stack.append((GROUP, n, end, power, ends[pos] + 1))
+                        pos, end, power, n = pos + 1, ends[pos], 0, []
+                        continue
+
+                    # list without brackets, like arguments list. Takes the rest of the group
+                    elif kind == Comma.kind:
+                        n = self.list(n + s[pos:end])
+                        pos, terms = end, False
+                        continue
+
+                    # list with brackets
+                    elif kind == Bracket.kind:
+                        ll, pos = self._list(s, pos + 1, end)
+                        n.append(ll)
+                        continue
+                    # closing brackets are disposed by self._list, so they shouldn't come up here
+                    elif kind == Bracket.closed:
+                        raise Exception("Unexpected bracket at %s" % i.line)
+
+                    # parameter, taking the rest of the group
+                    elif category & IS_PARAMETER:
+                        stack.append((PARAMETER, i))
+                        pos, power, n = pos + 1, 0, []
+                        continue
 
-            # list with brackets
-            elif isinstance(i, Bracket):
-                if i.open:
-                    n.append(src.lang.data.List(self.list(s)))
-                # closing brackets are disposed by self.list, so they shouldn't come up here
+                    # unary operator
+                    elif category & IS_UNARY_OP:
+                        stack.append((UNARY, n, i, power))
+                        pos, power, n = pos + 1, self._binding(i)[1], []
+                        continue
+
+                    elif not category & IS_OPERATOR:
+                        n.append(i)
+                        pos += 1
+                        continue
+
+                n, terms = self._terms(n), False
+
+            # operators, for as long as they bind tighter than power
+            if pos < end:
+                i = s[pos]
+                category = getattr(i, "category", 0)
+
+                # words following a complete expression are left out
+                if category & IS_OPERATOR and not category & IS_UNARY_OP:
+                    left, right = self._binding(i)
+                    if left >= power:
+                        # unary post operator
+                        if category & IS_UNARY_POST_OP:
+                            n = node.PostOp(i, n)
+                            pos += 1
+                        # binary operator
+                        else:
+                            stack.append((BINARY, n, i, power))
+                            pos, power, n, terms = pos + 1, right, [], True
+                        continue
+
+            # n is complete. Hand it to whatever was waiting for it
+            if len(stack) == 0:
+                return n
+
+            frame = stack.pop()
+            if frame[0] == GROUP:
+                _, outer, end, power, pos = frame
+                outer.append(n)
+                n, terms = outer, True
+            elif frame[0] == UNARY:
+                _, outer, operator, power = frame
+                outer.append(node.UnaryOp(operator, n))
+                n = self._terms(outer)
+            elif frame[0] == BINARY:
+                _, left, operator, power = frame
+                if operator.category & IS_ASSIGN:
+                    n = node.Assign(left, operator, n)
                 else:
-                    raise Exception("Unexpected bracket at %s" % i.line)
+                    n = node.BinOp(left, operator, n)
+            else:
+                n, pos = node.Param(frame[1], n), end
 
-            # parameter
-            elif isinstance(i, self.lang.Parameter):
-                return [i, self.build_ast(s)]
+    @staticmethod
+    def _terms(terms):
+        """
+        The operand made of terms standing next to each other. Two of them are a call
+        """
+        terms = [Parser._atom(t) for t in terms]
 
-            # operator delimits terms
-            elif isinstance(i, Operator):
-                if isinstance(i, UnaryOperator):
-                    # unary operator
-                    return [i, self.build_ast(s)]
+        if len(terms) == 0:
+            return None
+        if len(terms) == 1:
+            return terms[0]
+        if len(terms) == 2 and isinstance(terms[0], node.Name):
+            return node.Call(terms[0], terms[1])
 
-                elif isinstance(i, UnaryPostOperator):
-                    # unary post operator
-                    return [i, n]
-                # binary operator
-                else:
-                    return [n, i, self.build_ast(s)]
-            else:
-                n.append(i)
+        raise Exception("Unexpected %s after %s" % (terms[-1], terms[0]))
 
-        return n
+    @staticmethod
+    def _atom(term):
+        category = getattr(term, "category", 0)
+        if category & IS_IDENTIFIER:
+            return node.Name(term)
+        if category & IS_CONSTANT:
+            return node.Literal(term)
+        if term is None or isinstance(term, node.Node):
+            return term
+        raise Exception("Unexpected %s at %s" % (term, term.line))
+
+    @staticmethod
+    def _binding(operator):
+        try:
+            return BINDING[operator.kind]
+        except KeyError:
+            raise Exception(
+                "Unknown precedence of %s at %s" % (operator, operator.line)
+            )
@@ -0,0 +1,17 @@
+class Scope(dict):
+    """
+    Variables bound in a block of code, nested in the scope it was declared in.
+    Names not bound here are looked up along the enclosing scopes, and are None if
+    none has them. Names are always bound in the scope itself, so a block never
+    rebinds the variables of the scopes it is nested in
+    """
+
+    __slots__ = ("parent",)
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self.parent = parent
+
+    def __missing__(self, word):
+        parent = self.parent
+        return None if parent is None else parent[word]
@@ -0,0 +1,200 @@
+"""
+Functions translated to Python source, compiled and run as Python once they are
+called often enough. Only functions made of what the translator knows are
+translated. Any other keeps running on the interpreter
+"""
+
+from src import node
+from src.lang import data
+from src.lang import operator as op
+
+# operators with a Python counterpart of the same meaning
+OPERATORS = {
+    op.Add.kind: "+",
+    op.Subtract.kind: "-",
+    op.Multiply.kind: "*",
+    op.Divide.kind: "/",
+    op.Greater.kind: ">",
+    op.Lesser.kind: "<",
+    op.Equal.kind: "==",
+    op.Unequal.kind: "!=",
+}
+
+STEPS = {
+    op.Increment.kind: "+",
+    op.Decrement.kind: "-",
+}
+
+TAB = "    "
+
+
+class Unsupported(Exception):
+    """
+    Raised on what the translator has no Python for
+    """
+
+
+class Translator:
+    """
+    Writes the Python source of a function. Its variables become Python locals,
+    read from the scope it was declared in at first, as the interpreter nests every
+    call in that scope. Calls to itself go straight to the Python function, on the
+    same scope
+    """
+
+    def __init__(self, routine):
+        self.routine = routine
+        self.name = routine.identifier.word
+        self.parameters = [i.word for i in routine.get_signature()]
+        # values used as they are, rather than written out as Python
+        self.constants = []
+        # every variable the function uses, apart from its parameters
+        self.names = {}
+        self.lines = []
+        self.depth = 2
+
+        if self.name in self.parameters:
+            raise Unsupported("Parameter named as the function")
+
+    def source(self):
+        """
+        Source of a factory taking the constants, and returning the Python function
+        """
+        block = self.routine.get_block()
+        # the value of a function is the one of its last statement
+        last = block[-1] if len(block) > 0 else None
+        for statement in block[:-1]:
+            self.statement(statement)
+        self.result(last)
+
+        if self.depth != 2:
+            raise Unsupported("Block left open")
+
+        prologue = [TAB * 2 + "v_%s = scope[%r]" % (w, w) for w in self.names]
+        constants = "".join("k%d, " % k for k in range(len(self.constants)))
+        arguments = "".join("v_%s, " % p for p in self.parameters)
+        head = [
+            "def factory(constants):",
+            TAB + "(%s) = constants" % constants,
+            TAB + "def function(scope, arguments):",
+            TAB * 2 + "(%s) = arguments" % arguments,
+        ]
+        tail = [TAB + "return function"]
+        return "\n".join(head + prologue + self.lines + tail) + "\n"
+
+    def emit(self, line):
+        self.lines.append(TAB * self.depth + line)
+
+    def constant(self, value):
+        self.constants.append(value)
+        return "k%d" % (len(self.constants) - 1)
+
+    def variable(self, word):
+        if word not in self.parameters:
+            self.names[word] = None
+        return "v_%s" % word
+
+    def assigned(self, word):
+        if word == self.name:
+            raise Unsupported("Function bound again from its body")
+        return self.variable(word)
+
+    def result(self, last):
+        """
+        Return the value of the last statement
+        """
+        if type(last) is node.Assign and type(last.target) is node.Name:
+            self.statement(last)
+            # an assignment gives its target
+            self.emit("return %s" % self.constant(last.target.identifier))
+        elif last is None or isinstance(last, node.Statement):
+            if last is not None:
+                self.statement(last)
+            self.emit("return None")
+        else:
+            self.emit("return %s" % self.expression(last))
+
+    def statement(self, s):
+        kind = type(s)
+
+        if kind is node.If:
+            self.emit("if %s:" % self.expression(s.condition))
+            self.depth += 1
+            # blocks may be empty
+            self.emit("pass")
+        elif kind is node.Else:
+            self.depth -= 1
+            self.emit("else:")
+            self.depth += 1
+            self.emit("pass")
+        elif kind is node.End:
+            self.depth -= 1
+            if self.depth < 2:
+                raise Unsupported("End out of a block")
+        elif kind is node.Prnt:
+            self.emit("print(%s)" % self.expression(s.value))
+        elif kind is node.Assign and type(s.target) is node.Name:
+            value = self.expression(s.value)
+            self.emit("%s = %s" % (self.assigned(s.target.identifier.word), value))
+        elif isinstance(s, node.Statement):
+            raise Unsupported(s.keyword)
+        else:
+            self.emit(self.expression(s))
+
+    def expression(self, n):
+        kind = type(n)
+
+        if kind is node.Literal:
+            return self.constant(n.constant.eval())
+
+        if kind is node.Name:
+            return self.variable(n.identifier.word)
+
+        if kind is node.BinOp and n.operator.kind in OPERATORS:
+            left, right = self.expression(n.left), self.expression(n.right)
+            return "(%s %s %s)" % (left, OPERATORS[n.operator.kind], right)
+
+        if kind is node.PostOp and n.operator.kind in STEPS:
+            if type(n.operand) is not node.Name:
+                raise Unsupported(n)
+            v = self.assigned(n.operand.identifier.word)
+            return "(%s := %s %s 1)" % (v, v, STEPS[n.operator.kind])
+
+        if kind is node.ListLit:
+            return "List([%s])" % ", ".join(self.expression(i) for i in n.items)
+
+        if kind is node.Call:
+            return self.call(n)
+
+        raise Unsupported(n)
+
+    def call(self, n):
+        """
+        A call of the function to itself. Calls to anything else are left to the
+        interpreter
+        """
+        arguments = n.arguments
+        if n.callee.identifier.word != self.name or type(arguments) is not node.ListLit:
+            raise Unsupported(n)
+        if len(arguments.items) != len(self.parameters):
+            raise Unsupported(n)
+
+        values = "".join("%s, " % self.expression(i) for i in arguments.items)
+        return "function(scope, (%s))" % (values,)
+
+
+def translate(routine):
+    """
+    Python function running the body of routine, called with the scope it was
+    declared in and its arguments. None if the body has anything not translated
+    """
+    try:
+        translator = Translator(routine)
+        source = translator.source()
+    except Unsupported:
+        return None
+
+    namespace = {}
+    code = compile(source, "<def %s>" % translator.name, "exec")
+    exec(code, {"List": data.List}, namespace)
+    return namespace["factory"](tuple(translator.constants))
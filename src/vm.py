@@ -0,0 +1,607 @@
+"""
+Bytecode compiler and stack machine, an alternative to walking the syntax tree.
+A program compiles to a flat list of instructions, each an opcode along with its
+operand: a name, a constant, a jump target or a count. Jumps for every block are
+resolved as the program is compiled
+"""
+
+from dataclasses import dataclass
+
+from src import node
+from src.exc import EOF
+from src.lang import control, data
+from src.lang import operator as op
+from src.lang.base import IS_CALLABLE, IS_FUNCTION
+from src.scope import Scope
+
+# opcodes. The most frequent first, as the machine tests them in this order
+LOAD = 0
+CONST = 1
+STEP = 2
+SET_LAST = 3
+BRANCH = 4
+NONE_LAST = 5
+POP = 6
+JUMP = 7
+INC = 8
+LESSER = 9
+ADD = 10
+STORE = 11
+SUBTRACT = 12
+MULTIPLY = 13
+GREATER = 14
+EQUAL = 15
+UNEQUAL = 16
+DIVIDE = 17
+DEC = 18
+CALL = 19
+RETURN = 20
+LIST = 21
+PRINT = 22
+BINARY = 23
+UNARY = 24
+EXEC = 25
+PROC = 26
+DEF = 27
+EVAL = 28
+RAISE = 29
+HALT = 30
+
+# operators with an opcode of their own. Any other is run through its eval
+BINARY_OPS = {
+    op.Add.kind: ADD,
+    op.Subtract.kind: SUBTRACT,
+    op.Multiply.kind: MULTIPLY,
+    op.Divide.kind: DIVIDE,
+    op.Greater.kind: GREATER,
+    op.Lesser.kind: LESSER,
+    op.Equal.kind: EQUAL,
+    op.Unequal.kind: UNEQUAL,
+}
+
+POST_OPS = {
+    op.Increment.kind: INC,
+    op.Decrement.kind: DEC,
+}
+
+# where a procedure body starts from its PROC, past the jump over it
+BODY = 1
+
+
+@dataclass(frozen=True, slots=True)
+class Code:
+    ops: list
+    # statement index -> where its instructions start. Empty unless stepped through
+    steps: list
+    # variables of a function in the order of their slots, parameters first. None
+    # where they are read by name from a scope
+    names: tuple = None
+
+
+class Compiler:
+    """
+    Turns statements into bytecode. Top-level statements of a program mark where
+    they start, so it can be run one statement at a time
+    """
+
+    def __init__(self, steps=True, end=HALT, slots=None):
+        self.ops = []
+        # variable -> its slot, for the body of a function that has them
+        self.slots = slots
+        self.steps = [] if steps else None
+        self.end = end
+        # blocks still open: opening statement and the jumps to resolve at its end
+        self.blocks = []
+        # statements compiled so far
+        self.count = 0
+
+    def compile(self, instructions):
+        """
+        Compile statements following the ones compiled already, as a program is
+        streamed. Returns the code of them all. Statements come whole, so a block
+        is only left open where the source ends. It ends along with the code, as
+        the tree walker runs it up to EOF
+        """
+        if self.count > 0 or len(self.ops) > 0:
+            # carry on over the end of what was compiled last
+            del self.ops[-1]
+            if self.steps is not None:
+                self.steps.pop()
+
+        for statement in instructions:
+            if self.steps is not None:
+                self.steps.append(len(self.ops))
+                self.emit(STEP, self.count)
+            self.statement(statement)
+            self.count += 1
+
+        if self.steps is not None:
+            self.steps.append(len(self.ops))
+        self.close()
+        self.emit(self.end)
+        names = None if self.slots is None else tuple(self.slots)
+        return Code(self.ops, self.steps or [], names)
+
+    def emit(self, opcode, arg=0):
+        """
+        Append an instruction. Returns where it is, to resolve its jump later
+        """
+        self.ops.append((opcode, arg))
+        return len(self.ops) - 1
+
+    def variable(self, opcode, word, arg):
+        """
+        Emit an instruction on a variable, by slot where the function has them
+        """
+        if self.slots is None:
+            return self.emit(opcode, arg)
+        slot = self.slots[word]
+        return self.emit(opcode, (slot, arg) if opcode == STORE else slot)
+
+    def close(self):
+        """
+        Point the jumps of the blocks left open at the next instruction emitted
+        """
+        while len(self.blocks) > 0:
+            opening, jump, other = self.blocks.pop()
+            # past the else, if any. A loop condition is not a jump
+            if type(opening) is node.If and other is not None:
+                jump = other
+            self.resolve(jump)
+
+    def resolve(self, at, target=None):
+        """
+        Point the jump at an instruction to target, by default the next one emitted
+        """
+        self.ops[at] = (self.ops[at][0], len(self.ops) if target is None else target)
+
+    def statement(self, s):
+        kind = type(s)
+
+        if kind is node.If:
+            self.expression(s.condition)
+            self.blocks.append([s, self.emit(BRANCH, None), None])
+
+        elif kind is node.Else:
+            block = self.blocks[-1] if len(self.blocks) > 0 else None
+            if block is None or type(block[0]) is not node.If or block[2] is not None:
+                raise Exception("Else out of an if block")
+            # the branch taken jumps over the other one
+            block[2] = self.emit(JUMP, None)
+            self.resolve(block[1])
+            self.emit(NONE_LAST)
+
+        elif kind is node.For:
+            self.expression(s.init)
+            self.emit(POP)
+            condition = len(self.ops)
+            self.expression(s.condition)
+            self.blocks.append([s, self.emit(BRANCH, None), condition])
+
+        elif kind is node.End:
+            self.end_block()
+
+        elif kind is node.Procedure:
+            self.emit(PROC, s.keyword)
+            self.blocks.append([s, self.emit(JUMP, None), None])
+
+        elif kind is node.Def:
+            self.emit(DEF, s.keyword)
+
+        elif kind is node.Exec:
+            self.expression(s.arguments)
+            self.emit(EXEC, s.name.identifier)
+            self.emit(SET_LAST)
+
+        elif kind is node.Prnt:
+            self.expression(s.value)
+            self.emit(PRINT)
+
+        elif isinstance(s, node.Statement):
+            # anything else runs as the tree walker would
+            self.emit(EVAL, s)
+
+        else:
+            self.expression(s)
+            self.emit(SET_LAST)
+
+    def end_block(self):
+        if len(self.blocks) == 0:
+            # closing the program itself
+            self.emit(NONE_LAST)
+            return
+
+        opening, jump, other = self.blocks.pop()
+        kind = type(opening)
+
+        if kind is node.If:
+            # past the else, if any. Else past the block
+            self.resolve(jump if other is None else other)
+
+        elif kind is node.For:
+            self.expression(opening.increment)
+            self.emit(POP)
+            self.emit(JUMP, other)
+            self.resolve(jump)
+
+        elif kind is node.Procedure:
+            self.emit(RETURN)
+            self.resolve(jump)
+
+        self.emit(NONE_LAST)
+
+    def expression(self, n):
+        """
+        Operands first, then what they are for. Walked with an explicit stack, as
+        the tree walker does
+        """
+        stack = [(n, False)]
+
+        while len(stack) > 0:
+            n, ready = stack.pop()
+            operands = () if ready else n.operands() if n is not None else ()
+
+            if len(operands) > 0:
+                stack.append((n, True))
+                for operand in reversed(operands):
+                    stack.append((operand, False))
+                continue
+
+            kind = type(n)
+
+            if kind is node.Name:
+                word = n.identifier.word
+                self.variable(LOAD, word, word)
+            elif kind is node.Literal:
+                self.emit(CONST, n.constant.eval())
+            elif kind is node.BinOp:
+                opcode = BINARY_OPS.get(n.operator.kind)
+                if opcode is None:
+                    self.emit(BINARY, n.operator)
+                else:
+                    self.emit(opcode)
+            elif kind is node.Assign:
+                if type(n.target) is not node.Name:
+                    self.emit(RAISE, "Cannot assign to %s" % (n.target,))
+                else:
+                    identifier = n.target.identifier
+                    self.variable(STORE, identifier.word, identifier)
+            elif kind is node.PostOp:
+                opcode = POST_OPS.get(n.operator.kind)
+                if type(n.operand) is not node.Name or opcode is None:
+                    message = "Cannot apply %s to %s" % (n.operator, n.operand)
+                    self.emit(RAISE, message)
+                else:
+                    word = n.operand.identifier.word
+                    self.variable(opcode, word, word)
+            elif kind is node.UnaryOp:
+                self.emit(UNARY, n.operator)
+            elif kind is node.ListLit:
+                self.emit(LIST, len(n.items))
+            elif kind is node.Call:
+                identifier = n.callee.identifier
+                self.variable(CALL, identifier.word, identifier)
+            elif kind is node.Param:
+                # a parameter takes its argument as a unary operator does
+                self.emit(UNARY, n.parameter)
+            elif n is None:
+                self.emit(CONST, None)
+            else:
+                raise Exception("Cannot compile %s" % (n,))
+
+
+def compile(instructions, steps=True, end=HALT, slots=None):
+    """
+    Bytecode of a program, or of a function body with steps off and RETURN at its end
+    """
+    return Compiler(steps, end, slots).compile(instructions)
+
+
+def resolve(routine):
+    """
+    Slot of every variable a function names, its parameters first. None if it needs
+    them in a scope: routines it declares are nested in it, and anything run on the
+    scope as a whole reads it
+    """
+    slots = {}
+    for identifier in routine.get_signature():
+        if identifier.word in slots:
+            return None
+        slots[identifier.word] = len(slots)
+
+    # in the order they are run
+    roots = []
+    for s in routine.get_block():
+        kind = type(s)
+        if kind is node.If:
+            roots.append(s.condition)
+        elif kind is node.For:
+            roots.extend((s.init, s.condition, s.increment))
+        elif kind is node.Prnt:
+            roots.append(s.value)
+        elif kind is not node.Else and kind is not node.End:
+            if isinstance(s, node.Statement):
+                return None
+            roots.append(s)
+
+    nodes = roots[::-1]
+    while len(nodes) > 0:
+        n = nodes.pop()
+        kind = type(n)
+        if kind is node.UnaryOp or kind is node.Param:
+            return None
+        if kind is node.Name:
+            slots.setdefault(n.identifier.word, len(slots))
+        elif kind is node.Assign and type(n.target) is node.Name:
+            slots.setdefault(n.target.identifier.word, len(slots))
+        elif kind is node.PostOp and type(n.operand) is node.Name:
+            slots.setdefault(n.operand.identifier.word, len(slots))
+        elif kind is node.Call:
+            slots.setdefault(n.callee.identifier.word, len(slots))
+        if n is not None:
+            nodes.extend(reversed(n.operands()))
+
+    return slots
+
+
+class VM:
+    """
+    Runs bytecode over the memory of an interpreter: its scopes, instructions and
+    pointer. Routines run on a stack of frames rather than on the Python stack.
+    Functions keep their variables in a list of slots rather than a scope of their
+    own, seeded from the scope they were declared in
+    """
+
+    def __init__(self, interp, code=None):
+        self.interp = interp
+        self.main = code is None
+        # the program run, compiled further as it is streamed
+        self.compiler = Compiler() if code is None else None
+        self.code = self.compiler.compile(interp.memory.instr) if code is None else code
+        self.ops = self.code.ops
+        self.pc = 0
+        # statement it stopped at, to tell when the pointer was moved from outside
+        self.index = None
+        self.stack = []
+        # code and where to return to, for every routine running. Whether it is a
+        # function, that gives a value, and the slots of the one it returns to
+        self.frames = []
+        # function -> its bytecode
+        self.functions = {}
+
+    def next(self):
+        """
+        Run one top-level statement. Returns its value
+        """
+        if self.run(1) == 0:
+            raise EOF
+        return self.interp.last
+
+    def function(self, routine):
+        code = self.functions.get(id(routine))
+        if code is None:
+            slots = resolve(routine)
+            code = compile(routine.get_block(), steps=False, end=RETURN, slots=slots)
+            # the routine is kept along, so its id is not handed to another
+            self.functions[id(routine)] = (routine, code)
+            return code
+        return code[1]
+
+    def enter(self, closure, arguments, frame):
+        """
+        Open a scope for a routine with its arguments bound, nested in the one it was
+        declared in. Returns the code, where to run it from, and its slots if it has
+        them
+        """
+        routine, enclosing = closure.routine, closure.scope
+        signature = routine.get_signature()
+        if len(signature) != len(arguments):
+            raise Exception(
+                "Function expects %s arguments. Given %s"
+                % (len(signature), len(arguments))
+            )
+
+        self.frames.append(frame)
+        memory = self.interp.memory
+        code = self.function(routine) if routine.category & IS_FUNCTION else None
+
+        if code is not None and code.names is not None:
+            # the scope it was declared in is only read, to seed the slots
+            slots = list(arguments)
+            slots.extend(map(enclosing.__getitem__, code.names[len(slots) :]))
+            memory.scope.append(enclosing)
+            return code.ops, 0, slots
+
+        scope = Scope(enclosing)
+        for identifier, argument in zip(signature, arguments):
+            scope[identifier.word] = argument
+        memory.scope.append(scope)
+
+        if code is not None:
+            return code.ops, 0, None
+
+        return closure.entry + (None,)
+
+    def run(self, steps=None):
+        """
+        Run as many top-level statements as steps, or up to the end. Returns how
+        many were run
+        """
+        interp = self.interp
+        memory = interp.memory
+
+        if self.main and interp.instr_pointer != self.index:
+            # carry on from the statement the interpreter is at
+            starts = self.code.steps
+            self.pc = starts[min(interp.instr_pointer, len(starts) - 1)]
+            self.ops = self.code.ops
+            self.stack.clear()
+            self.frames.clear()
+
+        ops, pc = self.ops, self.pc
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        scope = memory.scope[-1]
+        # variables of the function running, if it has them in slots
+        slots = None
+        last = interp.last
+        index = interp.instr_pointer
+        done = 0
+
+        try:
+            while True:
+                opcode, arg = ops[pc]
+                pc += 1
+
+                if opcode == LOAD:
+                    push(scope[arg] if slots is None else slots[arg])
+                elif opcode == CONST:
+                    push(arg)
+                elif opcode == STEP:
+                    if done == steps:
+                        pc -= 1
+                        index = arg
+                        break
+                    done += 1
+                    index = arg
+                elif opcode == SET_LAST:
+                    last = pop()
+                elif opcode == BRANCH:
+                    # into the block, or past it. Either way, the statement gives None
+                    last = None
+                    if not pop():
+                        pc = arg
+                elif opcode == NONE_LAST:
+                    last = None
+                elif opcode == POP:
+                    pop()
+                elif opcode == JUMP:
+                    pc = arg
+                elif opcode == INC:
+                    if slots is None:
+                        scope[arg] += 1
+                        push(scope[arg])
+                    else:
+                        slots[arg] += 1
+                        push(slots[arg])
+                elif opcode == LESSER:
+                    right = pop()
+                    stack[-1] = stack[-1] < right
+                elif opcode == ADD:
+                    right = pop()
+                    stack[-1] = stack[-1] + right
+                elif opcode == STORE:
+                    if slots is None:
+                        identifier = arg
+                        scope[identifier.word] = stack[-1]
+                    else:
+                        slot, identifier = arg
+                        slots[slot] = stack[-1]
+                    # as Assign.eval, the value of an assignment is its target
+                    stack[-1] = identifier
+                elif opcode == SUBTRACT:
+                    right = pop()
+                    stack[-1] = stack[-1] - right
+                elif opcode == MULTIPLY:
+                    right = pop()
+                    stack[-1] = stack[-1] * right
+                elif opcode == GREATER:
+                    right = pop()
+                    stack[-1] = stack[-1] > right
+                elif opcode == EQUAL:
+                    right = pop()
+                    stack[-1] = stack[-1] == right
+                elif opcode == UNEQUAL:
+                    right = pop()
+                    stack[-1] = stack[-1] != right
+                elif opcode == DIVIDE:
+                    right = pop()
+                    stack[-1] = stack[-1] / right
+                elif opcode == DEC:
+                    if slots is None:
+                        scope[arg] -= 1
+                        push(scope[arg])
+                    else:
+                        slots[arg] -= 1
+                        push(slots[arg])
+                elif opcode == CALL:
+                    arguments = pop()
+                    closure = scope[arg.word] if slots is None else slots[arg]
+                    if closure is None or arguments is None:
+                        push(closure)
+                    elif (
+                        type(closure) is not control.Closure
+                        or not closure.routine.category & IS_FUNCTION
+                    ):
+                        push(closure.call(arguments, interp))
+                    else:
+                        python = closure.routine.python(interp, closure, arguments)
+                        if python is not None:
+                            push(python(closure.scope, arguments))
+                        else:
+                            frame = (ops, pc, True, slots)
+                            ops, pc, slots = self.enter(closure, arguments, frame)
+                            scope = memory.scope[-1]
+                elif opcode == RETURN:
+                    ops, pc, function, slots = frames.pop()
+                    memory.scope.pop()
+                    scope = memory.scope[-1]
+                    if not function:
+                        memory.stack.pop()
+                    # a function gives the value of its last statement
+                    push(last if function else None)
+                elif opcode == LIST:
+                    items = data.List(stack[len(stack) - arg :])
+                    del stack[len(stack) - arg :]
+                    push(items)
+                elif opcode == PRINT:
+                    print(pop())
+                    last = None
+                elif opcode == BINARY:
+                    right = pop()
+                    stack[-1] = arg.eval(stack[-1], right, scope)
+                elif opcode == UNARY:
+                    operator = arg
+                    stack[-1] = operator.eval(scope, arguments=stack[-1], interp=interp)
+                elif opcode == EXEC:
+                    arguments = pop()
+                    closure = scope[arg.word]
+                    if not getattr(closure, "category", 0) & IS_CALLABLE:
+                        raise Exception("Not a callable object")
+                    arguments = [] if arguments is None else arguments
+                    function = bool(closure.routine.category & IS_FUNCTION)
+                    frame = (ops, pc, function, slots)
+                    ops, pc, slots = self.enter(closure, arguments, frame)
+                    scope = memory.scope[-1]
+                    if not function:
+                        # where it returns to, as the tree walker keeps it
+                        memory.stack.append({"ret_addr": index})
+                elif opcode == PROC:
+                    interp.declare(arg, (ops, pc + BODY))
+                    last = None
+                elif opcode == DEF:
+                    interp.declare(arg)
+                    last = None
+                elif opcode == EVAL:
+                    interp.last = last
+                    last = interp.eval(arg)
+                    scope = memory.scope[-1]
+                elif opcode == RAISE:
+                    raise Exception(arg)
+                elif opcode == HALT:
+                    pc -= 1
+                    index = len(memory.instr)
+                    if not (self.main and interp.streaming) or done == steps:
+                        break
+                    # run on into the next statement streamed, if any
+                    interp.streaming = interp._load(statement=True)
+                    self.compiler.compile(memory.instr[self.compiler.count :])
+        finally:
+            self.ops, self.pc = ops, pc
+            interp.last = last
+            if self.main:
+                interp.instr_pointer = self.index = index
+
+        return done
@@ -0,0 +1,68 @@
+from bench import corpus, runner
+from bench.generate import Shape, generate, write
+
+
+def test_corpus_runs():
+    # every program in the corpus has to go through all of its phases
+    for workload in corpus.workloads():
+        for phase in workload.phases:
+            seconds, count = runner.PHASES[phase](workload.source)
+            assert seconds >= 0
+            assert count > 0
+
+
+def test_run_and_compare(tmp_path):
+    workload = corpus.Workload("tiny", "a = 1\nprnt a\n")
+    baseline = runner.run([workload], repeat=1)
+    assert set(baseline["results"]["tiny"]) == {"lex", "parse", "exec"}
+    assert baseline["results"]["tiny"]["lex"]["count"] == 10
+
+    filename = tmp_path / "baseline.json"
+    runner.save(baseline, filename)
+    assert runner.load(filename) == baseline
+
+    current = runner.load(filename)
+    current["results"]["tiny"]["parse"]["seconds"] = 1.0
+    current["results"]["tiny"]["exec"]["seconds"] *= 1.05
+    # added workloads have nothing to compare against
+    current["results"]["new"] = {"lex": {"seconds": 1.0, "count": 1}}
+
+    assert runner.compare(baseline, current) == [
+        ("tiny", "parse", baseline["results"]["tiny"]["parse"]["seconds"], 1.0)
+    ]
+    assert runner.compare(baseline, current, threshold=0.1, slack=1.0) == []
+    assert runner.missing(baseline, current) == [("new", "lex")]
+    assert runner.missing(current, baseline) == []
+
+
+def test_generate(tmp_path):
+    shape = Shape(statements=200, defs=3, procedures=3)
+    source = generate(shape, seed=1)
+    # the same seed gives the same program, another seed a different one
+    assert generate(shape, seed=1) == source
+    assert generate(shape, seed=2) != source
+
+    filename = tmp_path / "generated.ns"
+    with open(filename, "w", encoding="utf-8") as f:
+        write(f, shape, seed=1)
+    assert filename.read_text(encoding="utf-8") == source
+
+    for phase in corpus.PHASES:
+        seconds, count = runner.PHASES[phase](source)
+        assert count > 0
+
+
+def test_scale():
+    workloads = corpus.scale([10, 100], phases=("lex",))
+    assert [w.name for w in workloads] == ["10", "100"]
+    assert len(workloads[1].source) > len(workloads[0].source)
+
+    results = runner.run(workloads, repeat=1, memory=True)
+    assert set(results["results"]["10"]) == {"lex"}
+    assert results["results"]["10"]["lex"]["peak"] > 0
+
+
+def test_nesting():
+    workloads = corpus.nesting([10, 100])
+    assert [w.name for w in workloads] == ["10", "100"]
+    assert workloads[1].source.count("(") == 100
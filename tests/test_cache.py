@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+from src import cache
+from src.exc import EOF, UnexpectedSymbol
+from src.interp import Interpreter
+from src.lang.grammar import Lang
+
+SOURCE = """
+def f x,y
+    x * y + 1
+end
+for i=0; i<3; i++
+    r = f [i, 2]
+end
+prnt 'done', r
+"""
+
+
+def run(interp):
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        pass
+    return interp.scope()
+
+
+def test_warm_start(tmp_path, monkeypatch):
+    filename = tmp_path / "program.ns"
+    filename.write_text(SOURCE, encoding="utf-8")
+
+    cold = Interpreter().read(str(filename), is_file=True)
+    assert os.path.exists(cache.path(str(filename)))
+
+    # loaded from disk, with neither lexer nor parser at work
+    monkeypatch.setattr(Interpreter, "_load", None)
+    warm = Interpreter().read(str(filename), is_file=True)
+
+    assert warm.memory.instr == cold.memory.instr
+    assert warm.memory.starts == cold.memory.starts
+    assert warm.memory.firsts == cold.memory.firsts
+    # positions are resolved against the source read
+    assert warm.memory.instr[0].keyword.line == 1
+    assert run(warm)["r"] == run(cold)["r"] == 5
+
+
+def test_stale(tmp_path):
+    filename = tmp_path / "program.ns"
+    filename.write_text("a = 1\n", encoding="utf-8")
+    Interpreter().read(str(filename), is_file=True)
+
+    filename.write_text("a = 2\n", encoding="utf-8")
+    assert run(Interpreter().read(str(filename), is_file=True)) == {"a": 2}
+
+    # the language changed since
+    compiled = cache.path(str(filename))
+    with open(compiled, "rb") as f:
+        stored = f.read()
+    Lang.version += 1
+    try:
+        assert run(Interpreter().read(str(filename), is_file=True)) == {"a": 2}
+        with open(compiled, "rb") as f:
+            assert f.read() != stored
+    finally:
+        Lang.version -= 1
+
+
+def test_broken(tmp_path):
+    filename = tmp_path / "program.ns"
+    filename.write_text("a = 1\n", encoding="utf-8")
+    interp = Interpreter().read(str(filename), is_file=True)
+
+    compiled = cache.path(str(filename))
+    with open(compiled, "r+b") as f:
+        f.truncate(os.path.getsize(compiled) - 8)
+
+    assert cache.load(str(filename), interp.parser.lexer, Lang) is None
+    assert run(Interpreter().read(str(filename), is_file=True)) == {"a": 1}
+
+
+def test_directory(tmp_path):
+    filename = tmp_path / "program.ns"
+    filename.write_text("a = 1\n", encoding="utf-8")
+    directory = tmp_path / "compiled"
+
+    Interpreter().read(str(filename), is_file=True, cache=str(directory))
+    assert os.listdir(directory) == [os.path.basename(cache.path(str(filename)))]
+    assert not os.path.exists(tmp_path / cache.DIRECTORY)
+
+    Interpreter().read(str(filename), is_file=True, cache=False)
+    assert not os.path.exists(tmp_path / cache.DIRECTORY)
+
+
+def test_edit_after_warm_start(tmp_path):
+    filename = tmp_path / "program.ns"
+    filename.write_text("a = 1\nb = 2\nc = 3\n", encoding="utf-8")
+    Interpreter().read(str(filename), is_file=True)
+
+    interp = Interpreter().read(str(filename), is_file=True)
+    interp.edit(6, 11, "b = 20")
+    assert run(interp) == {"a": 1, "b": 20, "c": 3}
+
+
+def test_lazy(tmp_path):
+    filename = tmp_path / "program.ns"
+    filename.write_text(SOURCE, encoding="utf-8")
+
+    # compiled to disk lazy, and eager apart
+    lazy = Interpreter(lazy=True).read(str(filename), is_file=True)
+    eager = Interpreter().read(str(filename), is_file=True)
+    assert lazy.memory.instr[0].keyword.block is None
+    assert eager.memory.instr[0].keyword.block is not None
+    assert Interpreter().read(str(filename), is_file=True).memory.instr[0].keyword.block
+
+    # a body left unparsed is read from a copy, not from the file mapped
+    with open(filename, "r+b") as f:
+        f.truncate(0)
+    assert run(lazy)["r"] == 5
+
+
+def test_lazy_error(tmp_path):
+    filename = tmp_path / "program.ns"
+    filename.write_text("def f x\n    x = = 1\nend\nr = f [1]\n", encoding="utf-8")
+    interp = Interpreter(lazy=True).read(str(filename), is_file=True, cache=False)
+
+    # the body and its positions come from a copy, not from the file mapped
+    with open(filename, "r+b") as f:
+        f.truncate(0)
+    with pytest.raises(UnexpectedSymbol) as error:
+        run(interp)
+    assert str(error.value).startswith('Unexpected "=" at (1:8)')
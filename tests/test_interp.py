@@ -1,8 +1,14 @@
+import os
+
 import pytest
 
 from src.exc import EOF
+from src import interp as interpreter
 from src.interp import Interpreter
-from src.lang.control import Def, Main
+from src.lang.control import Closure, Def, Main
+from src.lang.grammar import Lang
+from src.lang.operator import Assign
+from src.scope import Scope
 
 # --- Constants for sample file paths ---
 ASSIGNMENT_AND_PRINT = "tests/sample/assignment_and_print.ns"
@@ -81,7 +87,7 @@ def test_function_with_return():
 
     assert interp.instr_pointer == len(interp.memory.instr)
     assert interp.memory.scope[0]["r"] == 6
-    assert isinstance(interp.memory.scope[0]["func"], Def)
+    assert isinstance(interp.memory.scope[0]["func"].routine, Def)
     assert (
         interp.memory.instr[interp.instr_pointer]
         if interp.instr_pointer < len(interp.memory.instr)
@@ -245,6 +251,193 @@ def test_decrement(source, expected):
         assert interp.scope() == expected
 
 
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        ("a = 10 - 3 - 2", 5),
+        ("a = 2 * 3 + 1", 7),
+        ("a = 1 + 2 * 3", 7),
+        ("a = 8 / 2 / 2", 2),
+        ("a = (2 + 3) * (4 - 1)", 15),
+        ("a = 1 + 1 == 2", True),
+    ],
+)
+def test_precedence(source, expected):
+    interp = Interpreter()
+    interp.read(source)
+
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        assert interp.scope()["a"] == expected
+
+
+def test_deeply_nested():
+    # far deeper than the recursion limit
+    depth = 20000
+    interp = Interpreter()
+    interp.read("a = " + "(" * depth + "1" + " + 1)" * depth)
+
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        assert interp.scope()["a"] == depth + 1
+
+
+def test_repeated_calls():
+    source = """
+    def f x,y
+        x * y + 1
+    end
+    for i=0; i<5; i++
+        r = f [i, 2]
+    end
+    z = f [0, 0]
+    """
+    interp = Interpreter()
+    interp.read(source)
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        pass
+    assert interp.scope()["r"] == 9
+    assert interp.scope()["z"] == 1
+
+
+def test_lazy():
+    source = """
+    def broken x
+        x = = 1
+    end
+    def f x,y
+        if x > 1
+            x = x - 1
+        end
+        x * y
+    end
+    r = f [3, 2]
+    """
+    with pytest.raises(Exception):
+        Interpreter().read(source)
+
+    interp = Interpreter(lazy=True)
+    interp.read(source)
+    interp.edit(0, 0, "z = 0")
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        pass
+
+    assert interp.scope()["r"] == 4
+    # left unparsed, as never called
+    assert interp.scope()["broken"].routine.block is None
+
+
+def test_run_twice():
+    interp = Interpreter()
+    interp.read(SAMPLE, is_file=True)
+    instr = list(interp.memory.instr)
+
+    scopes = []
+    for _ in range(2):
+        interp.goto(0)
+        interp.memory.scope = [Scope()]
+        try:
+            while True:
+                interp.exec_next()
+        except EOF:
+            pass
+        # every run binds closures of its own, of the same routines
+        scope = interp.scope().items()
+        scopes.append({k: v.routine if isinstance(v, Closure) else v for k, v in scope})
+
+    # running leaves the program as it was loaded
+    assert interp.memory.instr == instr
+    assert interp.memory.instr == Interpreter().read(SAMPLE, is_file=True).memory.instr
+    assert scopes[0] == scopes[1]
+
+
+def library(tmp_path):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "main.ns").write_text(
+        "include 'lib/a.ns'\ninclude 'lib/a.ns'\nr = twice [3]\n", encoding="utf-8"
+    )
+    # paths are relative to the file including, and a file is run once
+    (tmp_path / "lib" / "a.ns").write_text(
+        "include 'b.ns'\ndef twice x\n\tx + x\nend\nseen = seen + 1\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "lib" / "b.ns").write_text(
+        "include 'a.ns'\nseen = 0\n", encoding="utf-8"
+    )
+    return str(tmp_path / "main.ns")
+
+
+def run_file(filename, processes=1):
+    interp = Interpreter(processes=processes)
+    interp.read(filename, is_file=True)
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        pass
+    return interp
+
+
+def test_include(tmp_path):
+    interpreter.module.cache_clear()
+    interp = run_file(library(tmp_path))
+
+    assert interp.scope()["r"] == 6
+    assert interp.scope()["seen"] == 1
+    assert interp.instr_pointer == len(interp.memory.instr) == 3
+
+    # parsed once per process, until changed
+    run_file(str(tmp_path / "main.ns"))
+    assert interpreter.module.cache_info().hits == 2
+    (tmp_path / "lib" / "b.ns").write_text("seen = 10\n", encoding="utf-8")
+    assert run_file(str(tmp_path / "main.ns")).scope()["seen"] == 11
+    assert interpreter.module.cache_info().misses == 3
+
+
+def test_include_in_parallel(tmp_path):
+    interpreter.module.cache_clear()
+    interp = run_file(library(tmp_path), processes=2)
+
+    assert interp.scope()["seen"] == 1
+    # both were parsed to disk ahead, the one included by the other too
+    assert len(os.listdir(tmp_path / "lib" / "__nscache__")) == 2
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+def test_include_procedure(tmp_path, engine, capsys):
+    (tmp_path / "lib.ns").write_text(
+        "x = 0\ndef f\n  1\nend\nprocedure p y\n  x = f []\n  prnt x + y\nend\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "main.ns").write_text(
+        "include 'lib.ns'\nexec p [2]\nr = 3\n", encoding="utf-8"
+    )
+    interp = Interpreter(engine=engine).read(str(tmp_path / "main.ns"), is_file=True)
+    interp.run()
+
+    # run from the file it was declared in, back to the one calling it
+    assert interp.scope() == {
+        "x": 0,
+        "f": interp.scope()["f"],
+        "p": interp.scope()["p"],
+        "r": 3,
+    }
+    assert interp.instr_pointer == len(interp.memory.instr) == 3
+    assert len(interp.memory.scope) == 1
+    # on to its end, past the function it calls
+    assert "\n3\n" in capsys.readouterr().out
+
+
 def test_for_loop_false_condition():
     source = """
         x = 0
@@ -263,6 +456,33 @@ def test_for_loop_false_condition():
     assert interp.scope()["x"] == 0
 
 
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        # entered again, a loop starts over, even if it never ran
+        (
+            "for j=0; j<2; j++\n  for i=5; i<0; i++\n    prnt i\n  end\n"
+            "  prnt j\nend\n",
+            ["0", "1"],
+        ),
+        # and every call runs one of its own
+        (
+            "procedure p n\n  for i=0; i<2; i++\n    if n > 0\n      exec p [n - 1]\n"
+            "    end\n    prnt n\n  end\nend\nexec p [1]\n",
+            ["0", "0", "1", "0", "0", "1"],
+        ),
+    ],
+)
+def test_for_loop_entered_again(source, expected, engine, capsys):
+    interp = Interpreter(engine=engine).read(source)
+    interp.run()
+
+    assert [w for w in capsys.readouterr().out.split("\n") if w.isdigit()] == expected
+    assert interp.block_stack == [interp.block_stack[0]]
+    assert len(interp.memory.scope) == 1
+
+
 def test_for_loop_10_iterations():
     source = """
     for i=0; i<10; i++
@@ -300,3 +520,401 @@ def test_nested_for_loops():
     assert interp.scope()["x"] == 2
     assert interp.scope()["y"] == 2
     assert interp.scope()["z"] == 4
+
+
+def test_stream_runs_statements_as_they_arrive():
+    chunks = ["x = ", "1\nfor i=0; i<3", "; i++\n  x++\nend\n", "y = x\n"]
+    interp = Interpreter()
+    interp.read(iter(chunks), is_stream=True)
+
+    assert interp.memory.instr == []
+
+    interp.exec_next()
+    assert interp.scope()["x"] == 1
+    # the for block is loaded whole before it runs
+    assert len(interp.memory.instr) == 1
+
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        pass
+
+    assert interp.scope()["x"] == 4
+    assert interp.scope()["y"] == 4
+
+
+@pytest.mark.parametrize(
+    ("source", "start", "end", "text"),
+    [
+        ("a = 1\nb = 2\nc = 3\n", 6, 11, "b = 20"),
+        ("a = 1\nb = 2\nc = 3\n", 5, 5, "\nx = 0"),
+        ("a = 1\nb = 2\nc = 3\n", 0, 6, ""),
+        ("a = 1\nb = 2\nc = 3\n", 18, 18, "d = 4\n"),
+        ("a = 1\nif a == 1\nb = 2\nend\nc = 3", 16, 21, "x = a\nb = 1"),
+        ("a = 1\nif a == 1\nb = 2\nend\nc = 3", 11, 11, "2"),
+        (
+            "a = 1\nfor i=0; i<2; i++\nb = 2\nend\nc = 3",
+            29,
+            29,
+            "\nend\nfor j=0; j<1; j++",
+        ),
+    ],
+)
+def test_edit(source, start, end, text):
+    interp = Interpreter()
+    interp.read(source)
+    kept = list(interp.memory.instr)
+
+    interp.edit(start, end, text)
+
+    raw = source.encode("utf-8")
+    expected = Interpreter()
+    expected.read((raw[:start] + text.encode("utf-8") + raw[end:]).decode("utf-8"))
+
+    assert interp.memory.instr == expected.memory.instr
+    assert interp.memory.starts == expected.memory.starts
+    assert interp.memory.firsts == expected.memory.firsts
+    # the first statement is untouched by any edit after it
+    if start > 6:
+        assert interp.memory.instr[0] is kept[0]
+
+
+def test_edit_keeps_program_on_error():
+    interp = Interpreter()
+    interp.read("a = 1\nb = 2\n")
+    instr = list(interp.memory.instr)
+
+    with pytest.raises(Exception):
+        interp.edit(10, 11, "]")
+
+    assert interp.memory.instr == instr
+    interp.edit(10, 11, "3")
+
+    try:
+        while True:
+            interp.exec_next()
+    except EOF:
+        pass
+
+    assert interp.scope() == {"a": 1, "b": 3}
+
+
+def settle(interp):
+    """
+    What a program left behind, routines aside as every run declares its own
+    """
+    scope = {k: v for k, v in interp.scope().items() if not isinstance(v, Closure)}
+    return scope, interp.last, interp.instr_pointer, len(interp.memory.scope)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        ASSIGNMENT_AND_PRINT,
+        PROCEDURE,
+        FUNCTION_WITH_RETURN,
+        ARITHMETIC_EXPRESSIONS,
+        IF_ELSE_TRUE,
+        IF_ELSE_FALSE,
+        NESTED_STRUCTURES,
+        FOR_LOOP,
+        "tests/sample/for_loop_nested.ns",
+        SAMPLE,
+    ],
+)
+@pytest.mark.parametrize("engine", ["closure", "vm"])
+def test_engine_sample(source, engine):
+    tree = Interpreter().read(source, is_file=True)
+    tree.run()
+    interp = Interpreter(engine=engine).read(source, is_file=True)
+    interp.run()
+
+    assert settle(interp) == settle(tree)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "a = 1; b = a + 2 * 3; c = b > 6 and a == 1; d = not c",
+        "x = 5\nif x > 3\n  y = 1\nelse\n  y = 2\nend\nx",
+        "x = 0\nif x > 3\n  y = 1\n  if y\n    y = 3\n  end\nelse\n  y = 2\nend",
+        """
+        def f x
+            if x > 1
+                x = x - 1
+            else
+                x = 0
+            end
+            x * 2
+        end
+        l = [f [3], f [0]]
+        for i=0; i<4; i++
+            r = f [i]
+        end
+        """,
+        """
+        procedure p x
+            z = x + 1
+            y = z
+        end
+        exec p [1]
+        def g x
+            x * 3
+        end
+        exec g [2]
+        """,
+    ],
+)
+@pytest.mark.parametrize("engine", ["closure", "vm"])
+def test_engine(source, engine):
+    tree = Interpreter().read(source)
+    tree.run()
+    interp = Interpreter(engine=engine).read(source)
+    interp.run()
+
+    assert settle(interp) == settle(tree)
+
+
+def test_vm_loop_in_function():
+    source = """
+    def fact n
+        r = 1
+        for i=2; i<n+1; i++
+            r = r * i
+        end
+        r
+    end
+    f = fact [6]
+    f--
+    """
+    interp = Interpreter(engine="vm").read(source)
+    interp.run()
+
+    # jumps stay within the function body
+    assert interp.scope()["f"] == 719
+    assert "r" not in interp.scope()
+
+
+@pytest.mark.parametrize(
+    ("body", "expected"),
+    [
+        ("r = x\n  r++\n  r - y", {"x": 0, "r": 1, "y": 2}),
+        ("x and y\n  [x, x + 1]", {"x": 0, "y": 1}),
+        ("g [x]", {"x": 0, "g": 1}),
+        # the scope of the interpreter is read as a whole
+        ("not x", None),
+        ("exec g [x]", None),
+        ("def h\n  end", None),
+    ],
+)
+def test_vm_slots(body, expected):
+    from src import vm
+
+    interp = Interpreter().read("def f x\n  %s\nend" % body)
+    slots = vm.resolve(interp.memory.instr[0].keyword)
+    assert slots == expected
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        # a function sees the scope it was declared in, not the one it is called from
+        ("a = 1\ndef g\n  a\nend\ndef f a\n  g []\nend\nr = f [10]", 1),
+        ("def f x\n  def g y\n    x + y\n  end\n  g [1]\nend\nr = f [10]", 11),
+        # and binds its variables in its own
+        ("a = 1\ndef f x\n  a = a + x\n  a++\nend\nr = f [10] + a", 13),
+        # every call declares its own, nested in that call
+        (
+            "def f n\n  def g\n    n\n  end\n  if n > 0\n    t = f [n - 1]\n  end\n"
+            "  g []\nend\nr = f [2]",
+            2,
+        ),
+    ],
+)
+def test_lexical_scope(source, expected, engine):
+    interp = Interpreter(engine=engine).read(source)
+    interp.run()
+
+    assert interp.scope()["r"] == expected
+    assert len(interp.memory.scope) == 1
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        (
+            "procedure p\n  q = 1\nend\ndef f\n  exec p []\n  3\nend\nx = f []\ny = 9\n",
+            3,
+        ),
+        (
+            "procedure p n\n  for i=0; i<n; i++\n    a = i\n  end\nend\n"
+            "procedure o\n  exec p [2]\nend\ndef f\n  exec o []\n  exec p [3]\n  4\nend\n"
+            "x = f [] + f []\ny = 9\n",
+            8,
+        ),
+    ],
+)
+def test_exec_in_function(source, expected, engine):
+    # the procedure is run through, and the function goes on after it
+    interp = Interpreter(engine=engine).read(source)
+    interp.run()
+
+    assert interp.scope()["x"] == expected
+    assert interp.scope()["y"] == 9
+    assert len(interp.block_stack) == 1
+    assert len(interp.memory.scope) == 1
+    assert interp.memory.stack == []
+
+
+class Function(Def):
+    pass
+
+
+class Bind(Assign):
+    pass
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+def test_subclassed_keywords(engine, monkeypatch):
+    # subclasses are told apart by their category, as the classes they extend
+    monkeypatch.setitem(Lang.keywords, "def", lambda t: Function(t))
+    monkeypatch.setitem(Lang.symbols[Lang.r_equal], None, lambda t: Bind(t))
+    source = "def f x\n  if x > 1\n    x = 1\n  end\n  x + 1\nend\nr = f [3] + f [0]\n"
+    interp = Interpreter(engine=engine).read(source)
+    interp.run()
+
+    assert interp.scope()["r"] == 3
+    assert len(interp.block_stack) == 1
+
+
+def test_scope():
+    outer = Scope()
+    outer["a"] = 1
+    inner = Scope(outer)
+    inner["b"] = 2
+
+    assert (inner["a"], inner["b"], inner["c"]) == (1, 2, None)
+    inner["a"] = 3
+    assert (inner["a"], outer["a"]) == (3, 1)
+    assert inner == {"a": 3, "b": 2}
+
+
+def test_vm_step_by_step():
+    interp = Interpreter(engine="vm")
+    interp.read(PROCEDURE, is_file=True)
+
+    # the declaration is skipped over, and its body stepped through when called
+    interp.exec_next()
+    assert interp.instr_pointer == 5
+    interp.exec_next()
+    assert interp.instr_pointer == 1
+    assert len(interp.memory.scope) == 2
+    assert interp.memory.stack == [{"ret_addr": 5}]
+
+    # moved from outside, it carries on from there
+    interp.memory.scope = [Scope()]
+    interp.goto(0)
+    assert interp.run() > 0
+    assert interp.instr_pointer == len(interp.memory.instr)
+    with pytest.raises(EOF):
+        interp.exec_next()
+
+
+def test_vm_stream():
+    chunks = ["x = ", "1\nfor i=0; i<3", "; i++\n  x++\nend\n", "y = x\n"]
+    interp = Interpreter(engine="vm")
+    interp.read(iter(chunks), is_stream=True)
+
+    interp.exec_next()
+    assert interp.scope()["x"] == 1
+    assert len(interp.memory.instr) == 1
+
+    interp.run()
+    assert interp.scope()["y"] == 4
+
+
+def test_vm_include(tmp_path):
+    interp = Interpreter(engine="vm").read(library(tmp_path), is_file=True)
+    interp.run()
+
+    assert interp.scope()["r"] == 6
+    assert interp.scope()["seen"] == 1
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        ("if 0\n  z = 1\nb = 1\n", {}),
+        ("if 0\n  z = 1\nelse\n  b = 1\n", {"b": 1}),
+        ("for i=0; i<3; i++\n  z = i\n", {"i": 0, "z": 0}),
+        ("procedure p\n  z = 1\n", {}),
+    ],
+)
+def test_block_left_open(source, expected, engine):
+    # runs up to the end of the source, and stops there
+    interp = Interpreter(engine=engine).read(source)
+    interp.run()
+
+    assert {k: v for k, v in interp.scope().items() if k != "p"} == expected
+    assert interp.instr_pointer == len(interp.memory.instr)
+
+    if engine == "vm":
+        interp = Interpreter(engine=engine).read(iter([source]), is_stream=True)
+        interp.run()
+        assert {k: v for k, v in interp.scope().items() if k != "p"} == expected
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+@pytest.mark.parametrize(
+    "source",
+    [
+        "procedure p\n  z = 1\n",
+        "if 0\n  z = 1\n",
+        "for i=0; i<3; i++\n  z = i\n",
+        "procedure p\n  z = 1\nexec p []\n",
+    ],
+)
+def test_include_block_left_open(tmp_path, source, engine):
+    # what the file leaves open is closed where it ends
+    (tmp_path / "open.ns").write_text(source, encoding="utf-8")
+    (tmp_path / "main.ns").write_text("include 'open.ns'\nb = 1\n", encoding="utf-8")
+    interp = Interpreter(engine=engine).read(str(tmp_path / "main.ns"), is_file=True)
+    interp.run()
+
+    assert interp.scope()["b"] == 1
+    assert interp.ctrl_stack == [True]
+    assert len(interp.block_stack) == 1
+    assert len(interp.memory.scope) == 1
+    assert interp.memory.stack == []
+
+
+def test_closure_step_by_step():
+    source = "z = 0\nfor i=0; i<3; i++\n  z = z + i\nend\nw = (((z)))"
+    interp = Interpreter(engine="closure").read(source)
+
+    interp.exec_next()
+    assert interp.last == interp.memory.instr[0].target.identifier
+    snapshot = str(Interpreter.Snapshot(interp))
+    assert "Pointer" in snapshot
+
+    interp.run()
+    assert interp.scope() == {"z": 3, "i": 3, "w": 3}
+    assert interp.instr_pointer == len(interp.memory.instr)
+    # the loop body ran again and again, so it runs compiled. The rest ran once
+    body = interp.memory.instr[2]
+    assert interp.closures.statements[id(body)][1] is not None
+    assert interp.closures.statements[id(interp.memory.instr[4])][1] is None
+
+
+def test_closure_deeply_nested():
+    depth = 20000
+    source = "for i=0; i<2; i++\na = " + "(" * depth + "i" + " + 1)" * depth + "\nend"
+    interp = Interpreter(engine="closure").read(source)
+    interp.run()
+
+    # compiled on its second run, nested deeper than closures can call
+    assert interp.scope()["a"] == depth + 1
@@ -14,7 +14,7 @@ from src.lang.base import (
 from src.lang.data import Integer, Bool, Float
 from src.lang.control import If, End
 from src.lang.grammar import Lang
-from src.lexer import Lexer, Token
+from src.lexer import LineIndex, Lexer, Token
 
 ANY_POS = (ANY, ANY)
 
@@ -303,3 +303,265 @@ def test_next_is_false(source):
     lexer = Lexer(Lang, source)
 
     assert lexer.next() is False
+
+
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        (
+            "ñu = 'é'",
+            [
+                Token("ñu", 0, 0, 0),
+                Token(" ", 0, 2, 3),
+                Token("=", 0, 3, 4),
+                Token(" ", 0, 4, 5),
+                Token("'", 0, 5, 6),
+                Token("é", 0, 6, 7),
+                Token("'", 0, 7, 9),
+            ],
+        ),
+    ],
+)
+def test_scan_counts_bytes_on_multibyte_source(source, expected):
+    lexer = Lexer(Lang, source)
+
+    for exp in expected:
+        assert lexer._scan() == exp
+
+    assert lexer._scan() is None
+
+
+def test_next_keeps_line_after_lookahead_newline():
+    lexer = Lexer(Lang, "a=\nb")
+
+    for word, line, char in [("a", 0, 0), ("=", 0, 1), ("\n", 0, 2), ("b", 1, 0)]:
+        token = lexer.next()
+        assert (token.word, token.line, token.char) == (word, line, char)
+
+    assert lexer.next() is False
+
+
+@pytest.mark.parametrize(
+    ("words", "expected"),
+    [
+        (["=", "=", "="], op.EqualStrict),
+        (["!", "=", "="], op.UnequalStrict),
+        (["+", "+"], op.Increment),
+        (["/", "/"], Lang.CommentLine),
+        (["-", "3"], Integer),
+        (["-", "1.5"], Float),
+    ],
+)
+def test_symbol_table_step(words, expected):
+    table = Lang.symbol_table
+    state = table.START
+
+    for word in words:
+        state = table.step(state, word)
+
+    assert table.final[state] or table.accept[state] is not None
+    assert type(table.accept[state](Token("".join(words), 0, 0, 0))) is expected
+
+
+def test_symbol_table_is_shared():
+    assert Lexer(Lang, "a").syntax.symbol_table is Lexer(Lang, "b").syntax.symbol_table
+    assert Lang.symbol_table.step(Lang.symbol_table.START, "{") is None
+
+
+@pytest.mark.parametrize(
+    "filename",
+    ("tests/sample/sample.ns", "tests/sample/arithmetic_expressions.ns"),
+)
+def test_next_on_mapped_file(filename):
+    with open(filename, encoding="utf-8") as f:
+        expected = Lexer(Lang, f.read())
+
+    lexer = Lexer(Lang, filename, is_file=True)
+
+    while True:
+        exp = expected.next()
+        token = lexer.next()
+        if exp is False:
+            break
+        assert token == exp
+        assert token.byte == exp.byte
+        assert type(token) is type(exp)
+
+    assert token is False
+    assert lexer.tell() == expected.tell()
+    lexer.close()
+
+
+def test_next_on_empty_file(tmp_path):
+    filename = tmp_path / "empty.ns"
+    filename.write_bytes(b"")
+
+    assert Lexer(Lang, filename, is_file=True).next() is False
+
+
+def test_mapped_file_cut_short(tmp_path):
+    filename = tmp_path / "program.ns"
+    filename.write_text("x = 1\n" * 20000, encoding="utf-8")
+
+    lexer = Lexer(Lang, filename, is_file=True)
+    first = lexer.next()
+    assert (first.line, first.char) == (0, 0)
+    while (token := lexer.next()) is not False:
+        last = token
+    lexer.close()
+
+    # lexemes outliving the source as it was read fail to resolve, rather than crash
+    with open(filename, "r+b") as f:
+        f.truncate(0)
+    with pytest.raises(Exception, match="changed"):
+        last.line
+    # positions already resolved are kept
+    assert (first.line, first.char) == (0, 0)
+
+
+@pytest.mark.parametrize("size", (1, 2, 3, 5))
+@pytest.mark.parametrize(
+    "source",
+    ("foo===bar!==baz", "/* a */ // b\n -3.5 ++ñu", "tests/sample/sample.ns"),
+)
+def test_next_on_stream(source, size):
+    if source.endswith(".ns"):
+        with open(source, encoding="utf-8") as f:
+            source = f.read()
+
+    expected = Lexer(Lang, source)
+    raw = source.encode("utf-8")
+    lexer = Lexer(
+        Lang, (raw[i : i + size] for i in range(0, len(raw), size)), is_stream=True
+    )
+
+    while True:
+        exp = expected.next()
+        token = lexer.next()
+        if exp is False:
+            break
+        assert token == exp
+        assert token.byte == exp.byte
+        assert type(token) is type(exp)
+
+    assert token is False
+
+
+def test_stream_window_is_bounded(monkeypatch):
+    monkeypatch.setattr(Lexer, "WINDOW_SIZE", 16)
+    lexer = Lexer(Lang, ("a = 1\n" for _ in range(1000)), is_stream=True)
+
+    while lexer.next() is not False:
+        assert len(lexer.src) < 32
+
+
+@pytest.mark.parametrize(
+    "source",
+    ("foo===bar!==baz {x} -3 - 4", "a=\n-", "tests/sample/sample.ns"),
+)
+def test_tabulate(source):
+    if source.endswith(".ns"):
+        with open(source, encoding="utf-8") as f:
+            source = f.read()
+
+    expected = Lexer(Lang, source)
+    table = Lexer(Lang, source).tabulate()
+    reader = table.reader()
+
+    for i in range(len(table)):
+        exp = expected.next()
+        token = reader.next()
+        assert token == exp
+        assert token.byte == exp.byte
+        assert type(token) is type(exp)
+        assert table.word(i) == exp.word
+
+    assert expected.next() is False
+    assert reader.next() is False
+    assert reader.tell() == expected.tell()
+    assert reader.position() == expected.position()
+
+
+def test_tabulate_resumes_after_lookahead():
+    lexer = Lexer(Lang, "a=b")
+    lexer.next()
+    lexer.next()
+
+    table = lexer.tabulate()
+
+    assert len(table) == 1
+    assert table[0] == Identifier(Token("b", 0, 2, 2))
+
+
+@pytest.mark.parametrize(
+    ("source", "byte", "expected"),
+    [
+        ("foo;bar;baz", 0, (0, 0)),
+        ("foo;bar;baz", 3, (0, 3)),
+        ("foo;bar;baz", 4, (1, 0)),
+        ("foo\nbar\nbaz", 10, (2, 2)),
+        ("ñu\nñu", 6, (1, 1)),
+        ("ñu\nñu", 7, (1, 2)),
+    ],
+)
+def test_line_index_position(source, byte, expected):
+    lines = LineIndex(source.encode("utf-8"), Lang.r_newline)
+    assert lines.position(byte) == expected
+
+
+def test_line_index_is_lazy(monkeypatch):
+    monkeypatch.setattr(LineIndex, "SPAN", 4)
+    lines = LineIndex(b"a\nb\nc\nd\ne\nf\n", Lang.r_newline)
+
+    assert lines.position(2) == (1, 0)
+    assert lines.scanned < 12
+
+
+def test_next_resolves_position_lazily():
+    lexer = Lexer(Lang, "foo\nbar")
+    lexer.next()
+    lexer.next()
+    lexeme = lexer.next()
+
+    assert lexeme._line is None
+    assert (lexeme.line, lexeme.char, lexeme.byte) == (1, 0, 4)
+
+
+def test_position_follows_edit():
+    lexer = Lexer(Lang, "a = 1\nb = 2")
+    lexemes = []
+    while (lexeme := lexer.next()) is not False:
+        lexemes.append(lexeme)
+
+    b = lexemes[-5]
+    assert (b.word, b.line, b.char) == ("b", 1, 0)
+
+    edited = lexer.edit(0, 0, "x = 0\ny = 1\n")
+    lexer.lines.forward(0, 0, 12, edited.lines)
+
+    assert (b.line, b.char, b.byte) == (3, 0, 18)
+
+
+@pytest.mark.parametrize("is_file", (False, True))
+def test_tabulate_in_parallel(monkeypatch, is_file):
+    monkeypatch.setattr(Lexer, "PARALLEL_CHUNK", 64)
+    filename = "tests/sample/sample.ns"
+
+    with open(filename, encoding="utf-8") as f:
+        source = f.read()
+
+    expected = Lexer(Lang, source)
+    expected.next()
+    expected = expected.tabulate()
+
+    lexer = Lexer(Lang, filename, is_file=True) if is_file else Lexer(Lang, source)
+    # start off a line, right after the first lexeme
+    lexer.next()
+    table = lexer.tabulate(processes=3)
+
+    for column in ("kind", "byte", "length", "line", "char"):
+        assert getattr(table, column) == getattr(expected, column)
+    assert table.end == expected.end
+    assert [table.word(i) for i in range(len(table))] == [
+        expected.word(i) for i in range(len(expected))
+    ]
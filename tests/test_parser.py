@@ -2,15 +2,16 @@ import src.lang.operator
 from src.lang.base import Identifier, Space, SingleQuote, Bracket, Keyword, Parentheses
 from src.lang.data import Integer, String
 from src.lang.control import Procedure, If, Exec
-from src.exc import UnexpectedSymbol
+from src.exc import UnexpectedEOF, UnexpectedSymbol
 from src.parser import Parser
+from src import node
 from src.lang import operator as op
 from src.lang.grammar import Lang
 from src.lexer import Token
+import re
 import pytest
 from unittest.mock import ANY
 
-
 ANY_POS = (ANY, ANY)
 
 
@@ -118,7 +119,10 @@ def test_next(source, expected):
         ),
         (
             "if True:",
-            [Keyword(Token("if", 0, 0, 0)), [Identifier(Token("True", 0, 3, 3))]],
+            node.If(
+                Keyword(Token("if", 0, 0, 0)),
+                node.Literal(Identifier(Token("True", 0, 3, 3))),
+            ),
         ),
         (
             "[]",
@@ -137,7 +141,10 @@ def test_next(source, expected):
         ),
         (
             "prnt 'hello'",
-            [Lang.Prnt(Token("prnt", 0, 0, 0)), [String(Token("hello", 0, 6, 6))]],
+            node.Prnt(
+                Lang.Prnt(Token("prnt", 0, 0, 0)),
+                node.Literal(String(Token("hello", 0, 6, 6))),
+            ),
         ),
         (
             "1+2",
@@ -191,101 +198,136 @@ def test_parse_raises_unexpected_symbol(source):
         Parser(Lang, source).parse()
 
 
+def name(word, *pos):
+    return node.Name(Identifier(Token(word, 0, *pos)))
+
+
+def literal(cls, word, *pos):
+    return node.Literal(cls(Token(word, 0, *pos)))
+
+
 @pytest.mark.parametrize(
     ("source", "expected"),
     [
         (
             "1+2",
-            [
-                [Integer(Token("1", 0, 0, 0))],
+            node.BinOp(
+                literal(Integer, "1", 0, 0),
                 op.Add(Token("+", 0, 1, 1)),
-                [Integer(Token("2", 0, 2, 2))],
-            ],
+                literal(Integer, "2", 2, 2),
+            ),
         ),
         (
             "a * b",
-            [
-                [Identifier(Token("a", 0, 0, 0))],
-                op.Multiply(Token("*", 0, 2, 2)),
-                [Identifier(Token("b", 0, 4, 4))],
-            ],
+            node.BinOp(
+                name("a", 0, 0), op.Multiply(Token("*", 0, 2, 2)), name("b", 4, 4)
+            ),
         ),
         (
             "a + b * c",  # Testing operator precedence
-            [
-                [Identifier(Token("a", 0, 0, 0))],
+            node.BinOp(
+                name("a", 0, 0),
                 op.Add(Token("+", 0, 2, 2)),
-                [
-                    [Identifier(Token("b", 0, 4, 4))],
-                    op.Multiply(Token("*", 0, 6, 6)),
-                    [Identifier(Token("c", 0, 8, 8))],
-                ],
-            ],
+                node.BinOp(
+                    name("b", 4, 4), op.Multiply(Token("*", 0, 6, 6)), name("c", 8, 8)
+                ),
+            ),
         ),
         (
             "(a + b) * c",  # Testing parentheses grouping
-            [
-                [
-                    [Identifier(Token("a", 0, 1, 1))],
-                    op.Add(Token("+", 0, 3, 3)),
-                    [Identifier(Token("b", 0, 5, 5))],
-                ],
+            node.BinOp(
+                node.BinOp(
+                    name("a", 1, 1), op.Add(Token("+", 0, 3, 3)), name("b", 5, 5)
+                ),
                 op.Multiply(Token("*", 0, 8, 8)),
-                [Identifier(Token("c", 0, 10, 10))],
-            ],
-        ),
-        (
-            "'Hello' + ' ' + who",  # Testing right-associativity (adjusting based on previous failure)
-            [
-                [String(Token("Hello", 0, 1, 1))],
-                op.Add(Token("+", 0, 8, 8)),
-                [
-                    [String(Token(" ", 0, 11, 11))],
-                    op.Add(Token("+", 0, 14, 14)),
-                    [Identifier(Token("who", 0, 16, 16))],
-                ],
-            ],
-        ),
-        ("1", [Integer(Token("1", 0, 0, 0))]),
-        ("foo", [Identifier(Token("foo", 0, 0, 0))]),
+                name("c", 10, 10),
+            ),
+        ),
+        (
+            "'Hello' + ' ' + who",  # Testing left-associativity
+            node.BinOp(
+                node.BinOp(
+                    literal(String, "Hello", 1, 1),
+                    op.Add(Token("+", 0, 8, 8)),
+                    literal(String, " ", 11, 11),
+                ),
+                op.Add(Token("+", 0, 14, 14)),
+                name("who", 16, 16),
+            ),
+        ),
+        (
+            "a * b + c",  # Testing precedence regardless of order
+            node.BinOp(
+                node.BinOp(
+                    name("a", 0, 0), op.Multiply(Token("*", 0, 2, 2)), name("b", 4, 4)
+                ),
+                op.Add(Token("+", 0, 6, 6)),
+                name("c", 8, 8),
+            ),
+        ),
+        (
+            "a = b = c",  # Testing right-associativity
+            node.Assign(
+                name("a", 0, 0),
+                op.Assign(Token("=", 0, 2, 2)),
+                node.Assign(
+                    name("b", 4, 4), op.Assign(Token("=", 0, 6, 6)), name("c", 8, 8)
+                ),
+            ),
+        ),
+        (
+            "(a) - (b)",
+            node.BinOp(
+                name("a", 1, 1), op.Subtract(Token("-", 0, 4, 4)), name("b", 7, 7)
+            ),
+        ),
+        ("1", literal(Integer, "1", 0, 0)),
+        ("foo", name("foo", 0, 0)),
         (
             "!foo",
-            [
-                src.lang.operator.UnaryOperator(Token("!", 0, 0, 0)),
-                [Identifier(Token("foo", 0, 1, 1))],
-            ],
-        ),
-        (
-            "foo++",
-            [op.Increment(Token("++", 0, 3, 3)), [Identifier(Token("foo", 0, 0, 0))]],
+            node.UnaryOp(
+                src.lang.operator.UnaryOperator(Token("!", 0, 0, 0)), name("foo", 1, 1)
+            ),
         ),
+        ("foo++", node.PostOp(op.Increment(Token("++", 0, 3, 3)), name("foo", 0, 0))),
         (
             "1+2++",
-            [
-                [Integer(Token("1", 0, 0, 0))],
+            node.BinOp(
+                literal(Integer, "1", 0, 0),
                 op.Add(Token("+", 0, 1, 1)),
-                [op.Increment(Token("++", 0, 3, 3)), [Integer(Token("2", 0, 2, 2))]],
-            ],
-        ),
-        (
-            "NOT bar",
-            [op.Not(Token("NOT", 0, 0, 0)), [Identifier(Token("bar", 0, 4, 4))]],
+                node.PostOp(
+                    op.Increment(Token("++", 0, 3, 3)), literal(Integer, "2", 2, 2)
+                ),
+            ),
         ),
+        ("NOT bar", node.UnaryOp(op.Not(Token("NOT", 0, 0, 0)), name("bar", 4, 4))),
         (
             "1 == 2",
-            [
-                [Integer(Token("1", 0, 0, 0))],
+            node.BinOp(
+                literal(Integer, "1", 0, 0),
                 op.Equal(Token("==", 0, 2, 2)),
-                [Integer(Token("2", 0, 5, 5))],
-            ],
+                literal(Integer, "2", 5, 5),
+            ),
         ),
         (
             "1 != 2",
-            [
-                [Integer(Token("1", 0, 0, 0))],
+            node.BinOp(
+                literal(Integer, "1", 0, 0),
                 op.Unequal(Token("!=", 0, 2, 2)),
-                [Integer(Token("2", 0, 5, 5))],
-            ],
+                literal(Integer, "2", 5, 5),
+            ),
+        ),
+        (
+            "f [1, x], 2",
+            node.ListLit(
+                (
+                    node.Call(
+                        name("f", 0, 0),
+                        node.ListLit((literal(Integer, "1", 3, 3), name("x", 6, 6))),
+                    ),
+                    literal(Integer, "2", 10, 10),
+                )
+            ),
         ),
     ],
 )
@@ -307,67 +349,66 @@ def test_build_raises_unexpected_symbol(source):
         parser.build_ast(parser.parse_expression())
 
 
+def post(cls, word, line, char, byte, target):
+    return node.PostOp(
+        cls(Token(word, line, char + 1, byte + 2)),
+        node.Name(Identifier(Token(target, line, 0, byte))),
+    )
+
+
+def assign(target, value, line):
+    return node.Assign(
+        node.Name(Identifier(Token(target, line, 0, 1))),
+        op.Assign(Token("=", line, 1, 2)),
+        node.Literal(Integer(Token(value, line, 2, 3))),
+    )
+
+
 @pytest.mark.parametrize(
     ("source", "expected"),
     [
         (
             "foo++;bar++",
             [
-                [
+                node.PostOp(
                     op.Increment(Token("++", 0, 3, 5)),
-                    [Identifier(Token("foo", 0, 0, 3))],
-                ],
-                [
+                    node.Name(Identifier(Token("foo", 0, 0, 3))),
+                ),
+                node.PostOp(
                     op.Increment(Token("++", 1, 3, 5)),
-                    [Identifier(Token("bar", 1, 0, 3))],
-                ],
+                    node.Name(Identifier(Token("bar", 1, 0, 3))),
+                ),
             ],
         ),
         (
             "a=1;b=2;a++;b++",
             [
-                [
-                    [Identifier(Token("a", 0, 0, 1))],
-                    op.Assign(Token("=", 0, 1, 2)),
-                    [Integer(Token("1", 0, 2, 3))],
-                ],
-                [
-                    [Identifier(Token("b", 1, 0, 1))],
-                    op.Assign(Token("=", 1, 1, 2)),
-                    [Integer(Token("2", 1, 2, 3))],
-                ],
-                [op.Increment(Token("++", 2, 1, 3)), [Identifier(Token("a", 2, 0, 1))]],
-                [op.Increment(Token("++", 3, 1, 3)), [Identifier(Token("b", 3, 0, 1))]],
+                assign("a", "1", 0),
+                assign("b", "2", 1),
+                post(op.Increment, "++", 2, 0, 1, "a"),
+                post(op.Increment, "++", 3, 0, 1, "b"),
             ],
         ),
         (
             "foo--;bar--",
             [
-                [
+                node.PostOp(
                     op.Decrement(Token("--", 0, 3, 5)),
-                    [Identifier(Token("foo", 0, 0, 3))],
-                ],
-                [
+                    node.Name(Identifier(Token("foo", 0, 0, 3))),
+                ),
+                node.PostOp(
                     op.Decrement(Token("--", 1, 3, 5)),
-                    [Identifier(Token("bar", 1, 0, 3))],
-                ],
+                    node.Name(Identifier(Token("bar", 1, 0, 3))),
+                ),
             ],
         ),
         (
             "a=1;b=2;a--;b--",
             [
-                [
-                    [Identifier(Token("a", 0, 0, 1))],
-                    op.Assign(Token("=", 0, 1, 2)),
-                    [Integer(Token("1", 0, 2, 3))],
-                ],
-                [
-                    [Identifier(Token("b", 1, 0, 1))],
-                    op.Assign(Token("=", 1, 1, 2)),
-                    [Integer(Token("2", 1, 2, 3))],
-                ],
-                [op.Decrement(Token("--", 2, 1, 3)), [Identifier(Token("a", 2, 0, 1))]],
-                [op.Decrement(Token("--", 3, 1, 3)), [Identifier(Token("b", 3, 0, 1))]],
+                assign("a", "1", 0),
+                assign("b", "2", 1),
+                post(op.Decrement, "--", 2, 0, 1, "a"),
+                post(op.Decrement, "--", 3, 0, 1, "b"),
             ],
         ),
     ],
@@ -382,3 +423,200 @@ def test_build_ast(source, expected):
         assert exp == ast
 
     assert parser.parse() is False
+
+
+@pytest.mark.parametrize(
+    "filename",
+    ("tests/sample/sample.ns", "tests/sample/function_with_return.ns"),
+)
+def test_parse_tabulated_source(filename):
+    expected = Parser(Lang, filename, is_file=True)
+    parser = Parser(Lang, None)
+    parser.set_source(filename, is_file=True, tabulate=True)
+
+    while True:
+        exp = expected.parse()
+        assert parser.parse() == exp
+        if exp is False:
+            break
+
+
+def test_get_position():
+    parser = Parser(Lang, "a = 1\nb = 2")
+    parser.parse()
+
+    assert parser.get_position() == {"line": 1, "char": 0, "byte": 6}
+
+
+def test_unexpected_symbol_message():
+    parser = Parser(Lang, "a = 1\nb = ]")
+    parser.parse()
+
+    with pytest.raises(UnexpectedSymbol, match=r'Unexpected "\]" at \(1:4\)'):
+        parser.parse()
+
+
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        ("a = 1 /* x /*/ b */ c = 2", ["a", "=", "1", "c", "=", "2"]),
+        ("/* a **/ x = 1", ["x", "=", "1"]),
+        ("/* //*/ x = 1", ["x", "=", "1"]),
+        ("// a b\nx = 1", ["x", "=", "1"]),
+        ("x = 'a: {b} /* c */ #d'", ["x", "=", "a: {b} /* c */ #d"]),
+        ('x = "it\'s"', ["x", "=", "it's"]),
+    ],
+)
+def test_next_skips_comments_and_strings(source, expected):
+    parser = Parser(Lang, source)
+    words = []
+
+    while (lexeme := parser.next()) is not False:
+        if isinstance(lexeme, SingleQuote):
+            words.append(parser.lexer.raw(Lang.r_single_quote).word)
+        elif lexeme.word == '"':
+            words.append(parser.lexer.raw(Lang.r_double_quote).word)
+        else:
+            words.append(lexeme.word)
+
+    assert words == expected
+
+
+def test_parse_raises_unterminated_string():
+    with pytest.raises(UnexpectedEOF):
+        Parser(Lang, "x = 'abc").parse()
+
+
+def test_parse_long_list():
+    source = "a = [" + ", ".join(str(i) for i in range(5000)) + "]"
+    parser = Parser(Lang, source)
+    ast = parser.build_ast(parser.parse())
+
+    assert [item.constant for item in ast.value.items] == list(range(5000))
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "x\n",
+        "if x\n\tx = 1\nend\n",
+        "for i=0; i<2; i++\n\tif i\n\tend\nend\n",
+        "x = 'end'\n",
+        'x = "end"\n',
+        "// end\nx\n",
+        "/* end /*/ end */ x\n",
+        "x = ending + endless\n",
+    ],
+)
+def test_skip_block(body):
+    source = "def f x\n" + body + "end\ny = 2\n"
+    eager = Parser(Lang, source)
+    lazy = Parser(Lang, source, lazy=True)
+
+    expected = eager.parse()
+    skipped = lazy.parse()
+    assert skipped.body is None
+    assert skipped.keyword.body.base == len("def f x\n")
+
+    # parsing carries on past the function, and its body is parsed when asked for
+    assert lazy.build_ast(lazy.parse()) == eager.build_ast(eager.parse())
+    assert skipped.keyword.get_block() == expected.body
+
+
+def walk(sentence, rules):
+    # the rules tree walked word by word, as the table should
+    for i in sentence:
+        key = next((r for r in rules if re.match(r, i.type())), None)
+        if key is None:
+            return False
+        rules = rules[key]() if callable(rules[key]) else rules[key]
+    return True
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        "a = (1 + b) * 2",
+        "f [1, 2], c",
+        "a ++",
+        "a = = ,",
+        "= a",
+        ", a",
+        "a = )",
+        "a ++ (",
+        "[[1, 2] [3]]",
+        "not a",
+    ),
+)
+def test_expression_table(source):
+    parser = Parser(Lang, source)
+    sentence = []
+    while (lexeme := parser.next()) is not False:
+        sentence.append(lexeme)
+
+    expression = Lang.Expression()
+    pushed = all(expression.push(i) for i in sentence)
+
+    assert Lang.Grammar.is_legal(sentence, Lang.expression) is walk(
+        sentence, Lang.expression
+    )
+    assert pushed is walk(sentence, Lang.expression)
+
+
+def test_kinds():
+    from src.lang.base import IS_BLOCK, IS_CONTROL, IS_KEYWORD, IS_OPERATOR, IS_UNARY_OP
+
+    # every class gets its own kind, and the category bits of its bases
+    assert If.kind != Procedure.kind
+    assert (
+        If.category & (IS_KEYWORD | IS_BLOCK | IS_CONTROL)
+        == IS_KEYWORD | IS_BLOCK | IS_CONTROL
+    )
+    assert op.Not.category & (IS_OPERATOR | IS_UNARY_OP) == IS_OPERATOR | IS_UNARY_OP
+    assert not op.Add.category & IS_UNARY_OP
+
+    tokens = [Token("(")] * 2
+    assert Parentheses(tokens[0]).kind == Parentheses.kind
+    assert Parentheses(tokens[1], open=False).kind == Parentheses.closed
+
+
+def test_build_deeply_nested():
+    # far deeper than the recursion limit
+    depth = 20000
+    parser = Parser(Lang, "(" * depth + "a" + ")" * depth + " + b")
+    ast = parser.build_ast(parser.parse_expression())
+
+    assert ast.left == name("a", depth, depth)
+    assert ast.operator == op.Add(Token("+", 0, 2 * depth + 2, 2 * depth + 2))
+
+    parser = Parser(Lang, "x = " + "[" * depth + "1" + "]" * depth)
+    ast = parser.build_ast(parser.parse_expression()).value
+    for _ in range(depth - 1):
+        assert len(ast.items) == 1
+        ast = ast.items[0]
+    assert ast.items == (literal(Integer, "1", depth + 4, depth + 4),)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "x = ':a b'",
+        "x = '{y}'",
+        "x = ' (lead'",
+        'x = "a b"\ny = "[1, 2] + 3"',
+        "x = 'é ;'",
+    ],
+)
+def test_parse_tabulated_strings(source):
+    expected = Parser(Lang, source)
+    parser = Parser(Lang, None)
+    parser.set_source(source, tabulate=True)
+
+    while True:
+        exp = expected.parse()
+        p = parser.parse()
+        assert p == exp
+        if exp is False:
+            break
+        # the text of the string, as read from the source
+        assert parser.build_ast(p) == expected.build_ast(exp)
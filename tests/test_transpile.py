@@ -0,0 +1,102 @@
+import pytest
+
+from src.interp import Interpreter
+from src.transpile import Translator, Unsupported
+
+FIBONACCI = """
+def fib n
+    r = n
+    if n > 1
+        r = fib [n - 1] + fib [n - 2]
+    end
+    r
+end
+x = fib [15]
+"""
+
+
+def run(source, **kwargs):
+    interp = Interpreter(**kwargs).read(source)
+    interp.run()
+    return interp
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm"])
+def test_hot(engine, capsys):
+    interp = run(FIBONACCI, engine=engine, hot=5)
+    routine, calls, python = interp.translated[id(interp.scope()["fib"].routine)]
+
+    assert interp.scope()["x"] == 610
+    assert calls == 6
+    assert callable(python)
+    # calls from then on are Python's, not the interpreter's
+    if engine != "vm":
+        assert capsys.readouterr().out.count("Calling routine") == 5
+
+
+def test_cold():
+    interp = run(FIBONACCI)
+    assert interp.scope()["x"] == 610
+    assert interp.translated == {}
+
+
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        # the scope it is called from is read, but left as it was
+        ("a = 10\ndef f x\n  a = a + x\n  a\nend\nr = f [1]\nr = f [r]", 21),
+        (
+            "def f x\n  if x > 1\n    y = 1\n  else\n    y = 2\n  end\n  y\nend\nr = f [0]",
+            2,
+        ),
+        ("def f x\n  x++\n  x * 2\nend\nr = f [1] + f [2]", 10),
+        ("def f x\n  [x, x + 1]\nend\nr = f [1]", [1, 2]),
+        ("def f x,y\n  x / y\nend\nr = f [1, 2]", 0.5),
+    ],
+)
+def test_translated(source, expected):
+    for _ in range(3):
+        interp = run(source, hot=0)
+        closure = interp.scope()["f"]
+        assert callable(interp.translated[id(closure.routine)][2])
+        assert interp.scope()["r"] == expected
+        assert interp.scope() == run(source).scope() | {"f": closure}
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "for i=0; i<x; i++\n  x = x + 1\nend\nx",
+        "exec g [x]",
+        "g [x]",
+        "x and 1",
+        "not x",
+        "f = 1",
+        "if x > 1\n    f [x, 1]\n  end",
+    ],
+)
+def test_unsupported(body):
+    source = "def g x\n  x\nend\ndef f x\n  %s\nend\nr = f [1]\n" % body
+    interp = Interpreter().read(source)
+    routine = interp.memory.instr[1].keyword
+
+    with pytest.raises(Unsupported):
+        Translator(routine).source()
+
+    # left to the interpreter
+    interp = run(source, hot=0)
+    assert interp.translated[id(interp.scope()["f"].routine)][2] is False
+
+
+def test_assignment_last():
+    interp = run("def f x\n  y = x\nend\nr = f [1]", hot=0)
+    # an assignment gives its target
+    assert interp.scope()["r"].word == "y"
+    assert "y" not in interp.scope()
+
+
+def test_not_bound():
+    # called by another name, it can't tell itself from what it would call
+    source = FIBONACCI + "g = fib\nfib = 0\ny = g [1]"
+    interp = run(source, hot=0)
+    assert interp.scope()["y"] == 1